@@ -3,12 +3,47 @@ import json
 import os
 import requests
 from PIL import Image
+from pytesseract import image_to_string, pytesseract as _pytesseract
 import hashlib
+import io
+import re
 import time
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.wrappers import Response
+from frappe.utils.response import json_handler
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+try:
+	from tesserocr import PSM, PyTessBaseAPI
+except ImportError:
+	PyTessBaseAPI = None
+
+# Tesseract binary used by pytesseract, overridable for hosts where it is not on PATH
+_pytesseract.tesseract_cmd = os.environ.get("TESSERACT_CMD", _pytesseract.tesseract_cmd)
 
 # Import the existing image extraction function
 from exim_backend.api.image_reader import extract_text_from_image
 
+# DocType handler registry
+from exim_backend.api.doctypes import DOCTYPE_HANDLERS, get_handler
+
 # Import PDF chat integration for sales order creation from PDFs
 from exim_backend.api.pdf_chat_integration import (
 	PDFChatIntegration,
@@ -30,6 +65,149 @@ def estimate_tokens(text):
 	return len(text) // 4
 
 
+# JSON object inside a markdown code block in an AI response
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', re.DOTALL)
+
+# Flattens raw line breaks that make AI-written JSON invalid
+_JSON_LINE_BREAKS = str.maketrans({"\n": " ", "\r": None})
+
+# zstd frame magic number, used to tell compressed entries apart from plain ones
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_COMPRESSOR = zstandard.ZstdCompressor(level=3) if zstandard else None
+_ZSTD_DECOMPRESSOR = zstandard.ZstdDecompressor() if zstandard else None
+# Short messages grow under compression, only compress entries above this size
+_ZSTD_MIN_SIZE = 256
+
+# History is kept as a Redis list with one packed message per element
+_HISTORY_TTL = 86400
+# Hard cap on stored messages, applied with LTRIM on every append
+_HISTORY_MAX_MESSAGES = 20
+
+
+def _dumps_for_log(obj, indent=False):
+	"""JSON-encode obj for a log line, using orjson when installed."""
+	if orjson:
+		return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0, default=str).decode()
+	return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False, default=str)
+
+
+def _json_response(payload, cmd):
+	"""
+	Serialize an endpoint result with orjson when the endpoint is the request's own cmd.
+	Frappe passes a returned Response through untouched, so the {"message": ...} envelope is built here.
+	Internal callers (e.g. intelligent_query) get the plain dict back.
+	"""
+	if not orjson or frappe.form_dict.get("cmd") != cmd:
+		return payload
+	return Response(
+		# Dates/datetimes go through json_handler like Frappe's own responses (no ISO "T" format)
+		orjson.dumps(
+			{"message": payload},
+			default=json_handler,
+			option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+		),
+		mimetype="application/json"
+	)
+
+
+def _first_json_object(text):
+	"""
+	Return the first balanced {...} object in text, or None.
+	Braces inside JSON strings are skipped, so nested objects and trailing prose are handled.
+	"""
+	start = text.find("{")
+	if start == -1:
+		return None
+	
+	depth = 0
+	in_string = False
+	escaped = False
+	for i in range(start, len(text)):
+		ch = text[i]
+		if in_string:
+			if escaped:
+				escaped = False
+			elif ch == "\\":
+				escaped = True
+			elif ch == '"':
+				in_string = False
+		elif ch == '"':
+			in_string = True
+		elif ch == "{":
+			depth += 1
+		elif ch == "}":
+			depth -= 1
+			if depth == 0:
+				return text[start:i + 1]
+	return None
+
+
+def _history_name(session_id):
+	"""
+	Cache key (without the site prefix) of the history list for a session.
+	Versioned: ai_chat_history_<session> held a single pickled value, which a Redis
+	list operation on the same key would fail on with WRONGTYPE until it expired.
+	"""
+	return f"ai_chat_history_v2_{session_id}"
+
+
+def _dump_history(entry):
+	"""
+	Serialize a history entry for the cache.
+	The payload is msgpack (JSON when msgpack is not installed), zstd-compressed
+	when zstandard is installed. It never leaves the cache, so readability is not needed.
+	"""
+	if msgpack:
+		data = msgpack.packb(entry, use_bin_type=True)
+	else:
+		data = json.dumps(entry).encode("utf-8")
+	if _ZSTD_COMPRESSOR and len(data) > _ZSTD_MIN_SIZE:
+		data = _ZSTD_COMPRESSOR.compress(data)
+	return data
+
+
+def _load_history(cached_data):
+	"""
+	Deserialize a history entry written by _dump_history.
+	"""
+	if isinstance(cached_data, str):
+		cached_data = cached_data.encode("utf-8")
+	if not isinstance(cached_data, bytes):
+		return None
+	
+	if cached_data.startswith(_ZSTD_MAGIC):
+		if not _ZSTD_DECOMPRESSOR:
+			raise ValueError("zstandard is required to read compressed history")
+		cached_data = _ZSTD_DECOMPRESSOR.decompress(cached_data)
+	
+	# JSON objects start with "{", msgpack maps never do
+	if cached_data[:1] == b"{":
+		return json.loads(cached_data)
+	if not msgpack:
+		raise ValueError("msgpack is required to read packed history")
+	return msgpack.unpackb(cached_data, raw=False)
+
+
+def _read_history(session_id, start=0, end=-1):
+	"""Read history entries start..end (inclusive, Redis LRANGE semantics) for a session."""
+	try:
+		raw_entries = frappe.cache().lrange(_history_name(session_id), start, end)
+	except Exception as e:
+		frappe.logger().error(f"Error reading history from cache: {str(e)}")
+		return []
+	
+	history = []
+	for raw in raw_entries:
+		try:
+			entry = _load_history(raw)
+		except Exception as e:
+			frappe.logger().error(f"Error deserializing history: {str(e)}")
+			continue
+		if entry:
+			history.append(entry)
+	return history
+
+
 def get_conversation_history(session_id, limit=10):
 	"""
 	Get conversation history for a session.
@@ -38,86 +216,308 @@ def get_conversation_history(session_id, limit=10):
 	if not session_id:
 		return []
 	
-	cache_key = f"ai_chat_history_{session_id}"
-	cached_data = frappe.cache().get(cache_key)
-	
-	if cached_data:
-		try:
-			# Handle bytes (decode to string first)
-			if isinstance(cached_data, bytes):
-				cached_data = cached_data.decode('utf-8')
-			
-			# Deserialize from JSON if it's a string
-			if isinstance(cached_data, str):
-				history = json.loads(cached_data)
-			elif isinstance(cached_data, list):
-				# Already a list (shouldn't happen but handle it)
-				history = cached_data
-			else:
-				history = []
-		except (json.JSONDecodeError, TypeError, UnicodeDecodeError) as e:
-			frappe.logger().error(f"Error deserializing history: {str(e)}")
-			history = []
-	else:
-		history = []
-	
 	# Return last N messages
-	return history[-limit:] if history else []
+	return _read_history(session_id, -limit, -1)
+
+
+def _token_budget_cutoff(history, budget):
+	"""
+	Index of the oldest message to keep so the token estimate of the rest fits in budget.
+	The newest message is always kept. Token counts are cached on each entry as "_tok".
+	"""
+	total = 0
+	cutoff = len(history)
+	for i in range(len(history) - 1, -1, -1):
+		entry = history[i]
+		if "_tok" not in entry:
+			entry["_tok"] = estimate_tokens(entry.get("content"))
+		total += entry["_tok"]
+		if total > budget and cutoff < len(history):
+			break
+		cutoff = i
+	return cutoff
+
+
+def _compact_history(session_id):
+	"""
+	Background job: drop the oldest messages of a session that no longer fit the token budget.
+	Messages pushed while this runs are at the tail and are never trimmed.
+	"""
+	history = _read_history(session_id)
+	cutoff = _token_budget_cutoff(history, _site_conf("ai_chat_token_budget", 4000))
+	if cutoff:
+		frappe.cache().ltrim(_history_name(session_id), cutoff, -1)
 
 
 def save_to_history(session_id, role, content):
 	"""
 	Save a message to conversation history.
 	"""
-	if not session_id:
+	save_to_history_batch(session_id, [(role, content)])
+
+
+def save_to_history_batch(session_id, entries):
+	"""
+	Save several (role, content) messages to conversation history in order.
+	The messages are appended synchronously (the next turn reads them) with a single
+	pipelined RPUSH + LTRIM + EXPIRE round trip, which also caps the list length;
+	trimming to the token budget runs in the background.
+	"""
+	if not session_id or not entries:
 		return
 	
-	cache_key = f"ai_chat_history_{session_id}"
-	cached_data = frappe.cache().get(cache_key)
+	now = time.time()
+	packed = [
+		_dump_history({
+			"role": role,
+			"content": content,
+			"timestamp": now,
+			"_tok": estimate_tokens(content)
+		})
+		for role, content in entries
+	]
 	
-	if cached_data:
-		try:
-			# Handle bytes (decode to string first)
-			if isinstance(cached_data, bytes):
-				cached_data = cached_data.decode('utf-8')
-			
-			# Deserialize from JSON if it's a string
-			if isinstance(cached_data, str):
-				history = json.loads(cached_data)
-			elif isinstance(cached_data, list):
-				# Already a list (shouldn't happen but handle it)
-				history = cached_data
-			else:
-				history = []
-		except (json.JSONDecodeError, TypeError, UnicodeDecodeError) as e:
-			frappe.logger().error(f"Error deserializing history: {str(e)}")
-			history = []
-	else:
-		history = []
-	
-	history.append({
-		"role": role,
-		"content": content,
-		"timestamp": time.time()
-	})
-	
-	# Keep only last 20 messages to prevent memory issues
-	history = history[-20:]
-	
-	# Store in cache as JSON string (expires in 24 hours = 86400 seconds)
+	# Store in cache (expires in 24 hours = 86400 seconds)
 	try:
-		history_json = json.dumps(history)
-		frappe.cache().set(cache_key, history_json)
-		frappe.cache().expire(cache_key, 86400)
+		cache = frappe.cache()
+		key = cache.make_key(_history_name(session_id))
+		pipe = cache.pipeline()
+		pipe.rpush(key, *packed)
+		pipe.ltrim(key, -_HISTORY_MAX_MESSAGES, -1)
+		pipe.expire(key, _HISTORY_TTL)
+		pipe.execute()
 	except Exception as e:
 		frappe.logger().error(f"Error saving history to cache: {str(e)}")
+		return
+	
+	# Keep only the newest messages that fit the token budget. One job per session: concurrent
+	# compactions would each trim by their own snapshot and could drop too much.
+	try:
+		frappe.enqueue(
+			"exim_backend.api.ai_chat._compact_history",
+			queue="short",
+			job_id=f"ai_chat_compact_history::{session_id}",
+			deduplicate=True,
+			enqueue_after_commit=False,
+			session_id=session_id
+		)
+	except Exception as e:
+		frappe.logger().error(f"Error scheduling history compaction: {str(e)}")
 
 
 def clear_history(session_id):
 	"""Clear conversation history for a session."""
 	if session_id:
-		cache_key = f"ai_chat_history_{session_id}"
-		frappe.cache().delete(cache_key)
+		frappe.cache().delete_value(_history_name(session_id))
+
+
+# get_handler returns one shared instance per doctype
+_handler = get_handler
+
+
+# Handler methods served by the aggregate endpoints, resolved once per doctype
+_DISPATCH_METHODS = (
+	"get_customers_by_order_count",
+	"get_customers_by_order_value",
+	"get_orders_by_customer_group",
+	"get_orders_by_territory",
+	"get_orders_by_item",
+	"get_orders_with_most_items",
+	"get_orders_by_item_group",
+	"get_total_quantity_sold",
+	"get_total_quantity_sold_batch",
+	"get_most_sold_items",
+)
+_METHOD_CACHE = {}
+
+
+def _handler_methods(doctype):
+	"""Bound _DISPATCH_METHODS available on the doctype's handler, keyed by method name."""
+	methods = _METHOD_CACHE.get(doctype)
+	if methods is None:
+		handler = _handler(doctype)
+		if handler is None:
+			return {}
+		methods = {name: getattr(handler, name) for name in _DISPATCH_METHODS if hasattr(handler, name)}
+		_METHOD_CACHE[doctype] = methods
+	return methods
+
+
+class _FrozenEnvelope(dict):
+	"""
+	Read-only response dict, shared as a module constant for fixed error responses.
+	A plain dict subclass so json/orjson serialize it as-is (MappingProxyType would not serialize).
+	"""
+	__slots__ = ()
+	
+	def _readonly(self, *args, **kwargs):
+		raise TypeError("response envelope is read-only")
+	
+	__setitem__ = __delitem__ = __ior__ = _readonly
+	pop = popitem = setdefault = update = clear = _readonly
+
+
+def _error(message):
+	"""Shared read-only error envelope."""
+	return _FrozenEnvelope(status="error", message=message)
+
+
+_ERR_HANDLER_MISSING = _error("Handler or method not available")
+_ERR_CUSTOMER_GROUP_REQUIRED = _error("Customer group is required")
+_ERR_TERRITORY_REQUIRED = _error("Territory is required")
+_ERR_ITEM_CODE_REQUIRED = _error("Item code is required")
+_ERR_ITEM_CODES_REQUIRED = _error("Item codes are required")
+_ERR_INVALID_ITEM_CODES = _error("Item codes must be a JSON array of item code strings")
+_ERR_ITEM_GROUP_REQUIRED = _error("Item group is required")
+_ERR_DOCTYPE_REQUIRED = _error("DocType is required")
+_ERR_DOC_NAME_REQUIRED = _error("Document name is required")
+_ERR_INVALID_DOC_NAME = _error("Invalid document name")
+
+
+def _int_arg(name, default):
+	"""Integer request argument from frappe.form_dict, default is returned as-is when absent."""
+	value = frappe.form_dict.get(name)
+	return default if value is None else int(value)
+
+
+def api_endpoint(doctype, method_name):
+	"""
+	Decorator for endpoints backed by a single handler method.
+	Resolves the bound method from the dispatch table and passes it to the endpoint,
+	builds the error envelope and encodes the result list with orjson for HTTP callers.
+	The wrapper takes no arguments, endpoints read their inputs from frappe.form_dict.
+	"""
+	label = method_name.replace("_", " ")
+	
+	def decorator(fn):
+		cmd = f"{fn.__module__}.{fn.__name__}"
+		
+		def wrapper():
+			try:
+				method = _handler_methods(doctype).get(method_name)
+				if not method:
+					return _ERR_HANDLER_MISSING
+				
+				return _json_response(fn(method), cmd)
+			except Exception as e:
+				frappe.logger().error(f"{label.capitalize()} error: {str(e)}")
+				return {
+					"status": "error",
+					"message": f"Failed to {label}: {str(e)}"
+				}
+		
+		functools.update_wrapper(wrapper, fn)
+		# Frappe maps request args onto the signature it finds via inspect.signature,
+		# which would follow __wrapped__ to fn(method); the endpoint must look argument-less
+		del wrapper.__wrapped__
+		return wrapper
+	return decorator
+
+
+@functools.cache
+def _available_doctypes():
+	"""
+	Doctypes that have a handler registered. Static per deploy, so computed once per process.
+	Reset by clear_module_caches (clear_cache hook).
+	"""
+	from exim_backend.api.doctypes import get_available_doctypes
+	return tuple(get_available_doctypes())
+
+
+# Tesseract runs as a subprocess, so threads are enough to OCR several images in parallel
+_OCR_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="ai_chat_ocr")
+
+# One in-process Tesseract engine per OCR thread when tesserocr is installed.
+# PyTessBaseAPI is not thread-safe, keeping one per thread avoids a lock around OCR.
+_TESS_LOCAL = threading.local()
+
+# Uploads are downscaled to this long edge (px) before OCR, Tesseract time grows with pixel count
+_OCR_MAX_EDGE = 2000
+
+# Separators used by the prompt dump
+_LOG_BAR = "=" * 80
+_LOG_DASH = "-" * 80
+
+# Debug prompt dumps are formatted and written here so they don't delay the response
+_LOG_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ai_chat_log")
+
+# Site config values, keyed by (site, key). Site config only changes on deploy.
+_SITE_CONF_CACHE = {}
+
+# Single doctype defaults, keyed by (site, doctype, fieldname) -> (expires_at, value)
+_SINGLE_VALUE_CACHE = {}
+_SINGLE_VALUE_TTL = 60
+
+
+def _site_conf(key, default=None):
+	"""frappe.conf.get memoized per site for the life of the process."""
+	cache_key = (frappe.local.site, key)
+	if cache_key not in _SITE_CONF_CACHE:
+		_SITE_CONF_CACHE[cache_key] = frappe.conf.get(key, default)
+	return _SITE_CONF_CACHE[cache_key]
+
+
+def _single_value(doctype, fieldname):
+	"""frappe.db.get_single_value memoized per site for _SINGLE_VALUE_TTL seconds."""
+	cache_key = (frappe.local.site, doctype, fieldname)
+	cached = _SINGLE_VALUE_CACHE.get(cache_key)
+	now = time.monotonic()
+	if cached and cached[0] > now:
+		return cached[1]
+	value = frappe.db.get_single_value(doctype, fieldname)
+	_SINGLE_VALUE_CACHE[cache_key] = (now + _SINGLE_VALUE_TTL, value)
+	return value
+
+
+# DocType meta, keyed by (site, doctype) -> (expires_at, meta)
+_META_CACHE = {}
+_META_TTL = 60
+_META_CACHE_MAX = 256
+
+
+def _cached_meta(doctype):
+	"""
+	frappe.get_meta memoized per site for _META_TTL seconds.
+	Frappe only caches meta per request locally, every new request reloads it from Redis.
+	"""
+	cache_key = (frappe.local.site, doctype)
+	cached = _META_CACHE.get(cache_key)
+	now = time.monotonic()
+	if cached and cached[0] > now:
+		return cached[1]
+	meta = frappe.get_meta(doctype)
+	if len(_META_CACHE) >= _META_CACHE_MAX:
+		_META_CACHE.clear()
+	_META_CACHE[cache_key] = (now + _META_TTL, meta)
+	return meta
+
+
+# Read-only aggregation responses are shared across workers through Redis
+_RESPONSE_CACHE_TTL = 60
+
+
+def _cached_response(key_parts, fn, ttl=_RESPONSE_CACHE_TTL):
+	"""
+	Return fn() cached in Redis under key_parts for ttl seconds.
+	Only successful responses are cached so a transient error is not served for the whole TTL.
+	"""
+	cache = frappe.cache()
+	key = "ai_chat_response:" + "|".join(str(part) for part in key_parts)
+	result = cache.get_value(key)
+	if result is None:
+		result = fn()
+		if result.get("status") == "success":
+			cache.set_value(key, result, expires_in_sec=ttl)
+	return result
+
+
+def clear_module_caches():
+	"""Reset process-level caches of this module. Wired to the clear_cache hook."""
+	_available_doctypes.cache_clear()
+	_METHOD_CACHE.clear()
+	_SITE_CONF_CACHE.clear()
+	_SINGLE_VALUE_CACHE.clear()
+	_META_CACHE.clear()
 
 
 def build_optimized_system_prompt(doctype_fields_map):
@@ -136,8 +536,7 @@ def build_optimized_system_prompt(doctype_fields_map):
 	fields_section = "\n\n".join(doctype_sections) if doctype_sections else "No field metadata available"
 	
 	# Get available doctypes
-	from exim_backend.api.doctypes import get_available_doctypes
-	available_doctypes = ", ".join(get_available_doctypes())
+	available_doctypes = ", ".join(_available_doctypes())
 	
 	return f"""You are an ERPNext AI assistant. Help users with ERPNext data across multiple doctypes.
 
@@ -291,6 +690,46 @@ RULES:
 - Think before acting - understand intent and doctype first"""
 
 
+def _tess_api():
+	"""The calling thread's PyTessBaseAPI, created (and language data loaded) on first use."""
+	api = getattr(_TESS_LOCAL, "api", None)
+	if api is None:
+		api = _TESS_LOCAL.api = PyTessBaseAPI(psm=PSM.AUTO)
+	return api
+
+
+def _prepare_ocr_image(image):
+	"""Grayscale image with its long edge capped at _OCR_MAX_EDGE."""
+	# JPEG only: let the decoder produce a reduced, grayscale image directly
+	image.draft("L", (_OCR_MAX_EDGE, _OCR_MAX_EDGE))
+	width, height = image.size
+	scale = _OCR_MAX_EDGE / max(width, height)
+	if scale < 1.0:
+		image = image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+	return image.convert("L")
+
+
+def _ocr_bytes(data):
+	"""
+	Extract text from raw image bytes with Tesseract.
+	The image is decoded from memory, nothing is written to the site's temp folder.
+	Uses the in-process tesserocr engine when installed, otherwise the pytesseract subprocess.
+	Safe to run on _OCR_POOL: it only touches the bytes it is given.
+	"""
+	image = _prepare_ocr_image(Image.open(io.BytesIO(data)))
+	if PyTessBaseAPI:
+		api = _tess_api()
+		api.SetImage(image)
+		return api.GetUTF8Text()
+	
+	return image_to_string(image)
+
+
+def _ocr_image(image_file):
+	"""Extract text from an uploaded image with Tesseract."""
+	return _ocr_bytes(image_file.read())
+
+
 def get_ai_config():
 	"""Get AI API configuration."""
 	api_key = frappe.conf.get("openrouter_api_key") or frappe.conf.get("gemini_api_key")
@@ -385,6 +824,60 @@ def call_ai_api(messages, config, stream=False):
 		return response.text
 
 
+def _log_prompt(logger, session_id, detected_doctypes, messages, msg_tokens, history_count):
+	"""
+	Dump the exact prompt sent to the AI at debug level.
+	Runs on _LOG_EXECUTOR, so it only receives plain values and an already resolved logger.
+	"""
+	logger.debug(_LOG_BAR)
+	logger.debug("EXACT PROMPT BEING SENT TO AI")
+	logger.debug(_LOG_BAR)
+	logger.debug(f"Session ID: {session_id[:20]}...")
+	logger.debug(f"Detected DocTypes: {detected_doctypes}")
+	logger.debug(f"Total Messages: {len(messages)}")
+	logger.debug(f"Conversation History: {history_count} messages")
+	logger.debug(_LOG_DASH)
+	
+	# Log each message in the array
+	for idx, msg in enumerate(messages, 1):
+		role = msg.get("role", "unknown")
+		content = msg.get("content", "")
+		content_preview = content[:200] + "..." if len(content) > 200 else content
+		token_count = msg_tokens[idx - 1]
+		
+		logger.debug(f"\n[{idx}] Role: {role.upper()} ({token_count} tokens)")
+		logger.debug(f"Content Preview: {content_preview}")
+		
+		# For system prompt, log full content
+		if role == "system":
+			logger.debug("Full System Prompt:")
+			logger.debug(_LOG_DASH)
+			logger.debug(content)
+			logger.debug(_LOG_DASH)
+		# For history and user messages, log full content (they're usually shorter)
+		elif role in ["user", "assistant"]:
+			logger.debug(f"Full Content:")
+			logger.debug(content)
+	
+	logger.debug(_LOG_BAR)
+	logger.debug("END OF PROMPT LOG")
+	logger.debug(_LOG_BAR)
+	
+	# Also log as JSON for easy parsing (truncated for very long content)
+	try:
+		# Create a version for logging (truncate very long content, short messages are shared as-is)
+		messages_for_log = [
+			{**msg, "content": msg["content"][:5000] + f"\n... [TRUNCATED - {len(msg['content'])} total chars]"}
+			if len(msg["content"]) > 5000 else msg
+			for msg in messages
+		]
+		
+		logger.debug("Messages Array (JSON format, truncated if >5000 chars):")
+		logger.debug(_dumps_for_log(messages_for_log, indent=True))
+	except Exception as e:
+		logger.error(f"Error logging messages as JSON: {str(e)}")
+
+
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def process_chat():
 	"""
@@ -408,13 +901,14 @@ def process_chat():
 		4. User confirms/modifies data
 		5. Sales order is created automatically
 	"""
+	logger = frappe.logger()
 	try:
 		message = frappe.form_dict.get("message", "").strip()
 		image_file = frappe.request.files.get("image")
 		session_id = frappe.form_dict.get("session_id") or frappe.session.get("sid") or "default"
 		clear_hist = frappe.form_dict.get("clear_history", "false").lower() == "true"
 		
-		frappe.logger().info(f"Chat request - Session: {session_id[:10]}, Message: {message[:50] if message else 'None'}, Has Image: {bool(image_file)}")
+		logger.info(f"Chat request - Session: {session_id[:10]}, Message: {message[:50] if message else 'None'}, Has Image: {bool(image_file)}")
 		
 		# Clear history if requested
 		if clear_hist:
@@ -424,13 +918,12 @@ def process_chat():
 		# Check if user has an active PDF session (awaiting confirmation/modification)
 		pdf_context = check_pdf_context(session_id)
 		if pdf_context.get("has_context"):
-			frappe.logger().info(f"Active PDF session found for {session_id[:10]}, handling response")
+			logger.info(f"Active PDF session found for {session_id[:10]}, handling response")
 			# User is in middle of PDF workflow - handle their response
 			pdf_result = handle_pdf_response(session_id, message)
 			
 			# Save to history
-			save_to_history(session_id, "user", message)
-			save_to_history(session_id, "assistant", pdf_result["message"])
+			save_to_history_batch(session_id, [("user", message), ("assistant", pdf_result["message"])])
 			
 			return {
 				"status": pdf_result.get("status", "success"),
@@ -443,7 +936,7 @@ def process_chat():
 		# Check for PDF file upload
 		pdf_file = frappe.request.files.get("pdf") or frappe.request.files.get("file")
 		if pdf_file and pdf_file.filename.lower().endswith('.pdf'):
-			frappe.logger().info(f"PDF file uploaded: {pdf_file.filename}")
+			logger.info(f"PDF file uploaded: {pdf_file.filename}")
 			
 			try:
 				# Save PDF to files
@@ -457,15 +950,15 @@ def process_chat():
 				)
 				file_url = file_doc.file_url
 				
-				frappe.logger().info(f"PDF saved to: {file_url}")
+				logger.info(f"PDF saved to: {file_url}")
 				
 				# AUTOMATICALLY process any PDF upload for sales order creation
-				frappe.logger().info(f"Automatically processing PDF for sales order creation")
+				logger.info(f"Automatically processing PDF for sales order creation")
 				try:
 					pdf_result = handle_pdf_in_chat(file_url, session_id, message or "Create sales order from PDF")
 				except Exception as pdf_error:
-					frappe.logger().error(f"Error in handle_pdf_in_chat: {str(pdf_error)}")
-					frappe.logger().exception("Full traceback:")
+					logger.error(f"Error in handle_pdf_in_chat: {str(pdf_error)}")
+					logger.exception("Full traceback:")
 					return {
 						"status": "error",
 						"response": f"❌ Failed to process PDF: {str(pdf_error)}. Please check server logs for details.",
@@ -474,8 +967,10 @@ def process_chat():
 					}
 				
 				# Save to history
-				save_to_history(session_id, "user", f"{message or 'Uploaded PDF'} [PDF: {pdf_file.filename}]")
-				save_to_history(session_id, "assistant", pdf_result.get("message", "PDF processed"))
+				save_to_history_batch(session_id, [
+					("user", f"{message or 'Uploaded PDF'} [PDF: {pdf_file.filename}]"),
+					("assistant", pdf_result.get("message", "PDF processed"))
+				])
 				
 				return {
 					"status": pdf_result.get("status", "success"),
@@ -485,8 +980,8 @@ def process_chat():
 					"session_id": session_id
 				}
 			except Exception as e:
-				frappe.logger().error(f"Error processing PDF file: {str(e)}")
-				frappe.logger().exception("Full traceback:")
+				logger.error(f"Error processing PDF file: {str(e)}")
+				logger.exception("Full traceback:")
 				return {
 					"status": "error",
 					"response": f"❌ Failed to process PDF file: {str(e)}. Please ensure the file is a valid PDF and try again.",
@@ -505,18 +1000,8 @@ def process_chat():
 		# Extract text from image if provided
 		extracted_text = ""
 		if image_file:
-			# Save temporarily and extract text
-			temp_path = frappe.get_site_path("public", "temp")
-			os.makedirs(temp_path, exist_ok=True)
-			filepath = os.path.join(temp_path, image_file.filename)
-			image_file.save(filepath)
-			
 			# Extract text using OCR
-			from pytesseract import image_to_string
-			extracted_text = image_to_string(Image.open(filepath))
-			
-			# Cleanup
-			os.remove(filepath)
+			extracted_text = _ocr_image(image_file)
 			
 			# If no message, use extracted text as message
 			if not message:
@@ -528,8 +1013,6 @@ def process_chat():
 		config = get_ai_config()
 		
 		# Detect doctypes from message or use default (Customer for now)
-		from exim_backend.api.doctypes import get_available_doctypes, get_handler
-		
 		# Simple doctype detection from message
 		message_lower = message.lower()
 		detected_doctypes = []
@@ -544,8 +1027,7 @@ def process_chat():
 			"Purchase Order": ["purchase order", "purchase orders", "po"],
 		}
 		
-		available_doctypes = get_available_doctypes()
-		for doctype in available_doctypes:
+		for doctype in _available_doctypes():
 			keywords = doctype_keywords.get(doctype, [doctype.lower()])
 			if any(keyword in message_lower for keyword in keywords):
 				detected_doctypes.append(doctype)
@@ -557,7 +1039,7 @@ def process_chat():
 		# Fetch field metadata for detected doctypes
 		doctype_fields_map = {}
 		for doctype in detected_doctypes:
-			handler = get_handler(doctype)
+			handler = _handler(doctype)
 			if handler:
 				fields_info = handler.get_fields_info()
 				doctype_fields_map[doctype] = handler.build_field_reference(fields_info)
@@ -570,184 +1052,143 @@ def process_chat():
 		# Get conversation history
 		history = get_conversation_history(session_id, limit=10)
 		
-		# Build messages array
+		# Calculate token usage
+		system_tokens = estimate_tokens(system_prompt)
+		user_tokens = estimate_tokens(message)
+		
+		# Build messages array, with per-message token counts kept in msg_tokens
 		messages = [{"role": "system", "content": system_prompt}]
+		msg_tokens = [system_tokens]
 		
 		# Add conversation history
 		for h in history:
 			messages.append({"role": h["role"], "content": h["content"]})
+			msg_tokens.append(h.get("_tok") or estimate_tokens(h["content"]))
 		
 		# Add current user message
 		messages.append({"role": "user", "content": message})
+		msg_tokens.append(user_tokens)
 		
-		# Calculate token usage
-		total_tokens = sum([estimate_tokens(msg["content"]) for msg in messages])
-		max_tokens = frappe.conf.get("ai_max_tokens", 8000)  # Default limit
+		total_tokens = sum(msg_tokens)
+		max_tokens = _site_conf("ai_max_tokens", 8000)  # Default limit
 		
 		# Truncate history if too long
 		if total_tokens > max_tokens:
 			# Keep system prompt and current message, reduce history
 			excess = total_tokens - max_tokens
-			system_tokens = estimate_tokens(system_prompt)
-			user_tokens = estimate_tokens(message)
 			available_for_history = max_tokens - system_tokens - user_tokens - 500  # Buffer
 			
-			# Keep only recent history that fits
-			trimmed_history = []
+			# Keep only recent history that fits (history[i] is messages[i + 1])
+			keep_from = len(history)
 			history_tokens = 0
-			for h in reversed(history):
-				h_tokens = estimate_tokens(h["content"])
-				if history_tokens + h_tokens <= available_for_history:
-					trimmed_history.insert(0, h)
-					history_tokens += h_tokens
-				else:
+			for i in reversed(range(len(history))):
+				h_tokens = msg_tokens[i + 1]
+				if history_tokens + h_tokens > available_for_history:
 					break
+				history_tokens += h_tokens
+				keep_from = i
 			
-			messages = [{"role": "system", "content": system_prompt}]
-			for h in trimmed_history:
-				messages.append({"role": h["role"], "content": h["content"]})
-			messages.append({"role": "user", "content": message})
-			total_tokens = sum([estimate_tokens(msg["content"]) for msg in messages])
+			messages = [messages[0], *messages[keep_from + 1:]]
+			msg_tokens = [msg_tokens[0], *msg_tokens[keep_from + 1:]]
+			total_tokens = sum(msg_tokens)
 		
 		# Log token usage
-		frappe.logger().info(f"Token usage - Total: {total_tokens}, System: {estimate_tokens(system_prompt)}, History: {len(history)} msgs, User: {estimate_tokens(message)}")
-		
-		# Log the exact prompt being sent to AI
-		frappe.logger().info("=" * 80)
-		frappe.logger().info("EXACT PROMPT BEING SENT TO AI")
-		frappe.logger().info("=" * 80)
-		frappe.logger().info(f"Session ID: {session_id[:20]}...")
-		frappe.logger().info(f"Detected DocTypes: {detected_doctypes}")
-		frappe.logger().info(f"Total Messages: {len(messages)}")
-		frappe.logger().info(f"Conversation History: {len(history)} messages")
-		frappe.logger().info("-" * 80)
-		
-		# Log each message in the array
-		for idx, msg in enumerate(messages, 1):
-			role = msg.get("role", "unknown")
-			content = msg.get("content", "")
-			content_preview = content[:200] + "..." if len(content) > 200 else content
-			token_count = estimate_tokens(content)
-			
-			frappe.logger().info(f"\n[{idx}] Role: {role.upper()} ({token_count} tokens)")
-			frappe.logger().info(f"Content Preview: {content_preview}")
-			
-			# For system prompt, log full content
-			if role == "system":
-				frappe.logger().info("Full System Prompt:")
-				frappe.logger().info("-" * 80)
-				frappe.logger().info(content)
-				frappe.logger().info("-" * 80)
-			# For history and user messages, log full content (they're usually shorter)
-			elif role in ["user", "assistant"]:
-				frappe.logger().info(f"Full Content:")
-				frappe.logger().info(content)
-		
-		frappe.logger().info("=" * 80)
-		frappe.logger().info("END OF PROMPT LOG")
-		frappe.logger().info("=" * 80)
-		
-		# Also log as JSON for easy parsing (truncated for very long content)
-		try:
-			# Create a version for logging (truncate very long content)
-			messages_for_log = []
-			for msg in messages:
-				msg_copy = msg.copy()
-				content = msg_copy.get("content", "")
-				if len(content) > 5000:
-					msg_copy["content"] = content[:5000] + f"\n... [TRUNCATED - {len(content)} total chars]"
-				messages_for_log.append(msg_copy)
-			
-			frappe.logger().info("Messages Array (JSON format, truncated if >5000 chars):")
-			frappe.logger().info(json.dumps(messages_for_log, indent=2, ensure_ascii=False))
-		except Exception as e:
-			frappe.logger().error(f"Error logging messages as JSON: {str(e)}")
+		logger.info(f"Token usage - Total: {total_tokens}, System: {system_tokens}, History: {len(history)} msgs, User: {user_tokens}")
 		
-		# Save user message to history
-		save_to_history(session_id, "user", message)
+		# Log the exact prompt being sent to AI (debug only, off the request thread)
+		if logger.isEnabledFor(logging.DEBUG):
+			_LOG_EXECUTOR.submit(_log_prompt, logger, session_id, detected_doctypes, messages, msg_tokens, len(history))
 		
 		# Generate response using AI with conversation history
-		ai_response = call_ai_api(messages, config, stream=False)
+		try:
+			ai_response = call_ai_api(messages, config, stream=False)
+		except Exception:
+			# Keep the user's turn even when the AI call fails
+			save_to_history(session_id, "user", message)
+			raise
 		
-		# Save AI response to history
-		save_to_history(session_id, "assistant", ai_response)
+		# Save the user message and AI response to history together
+		save_to_history_batch(session_id, [("user", message), ("assistant", ai_response)])
 		
 		# Try to parse if there's a suggested action in the response
 		suggested_action = None
 		try:
 			# Look for JSON in the response
-			if "suggested_action" in ai_response.lower() or "action" in ai_response.lower():
-				# Remove markdown code blocks if present
-				import re
-				
+			# Actions are JSON objects, so their keys always appear quoted
+			if '"suggested_action"' in ai_response or '"action"' in ai_response:
 				# Try to find JSON in markdown code blocks first (more specific)
-				json_pattern = r'```(?:json)?\s*(\{[\s\S]*?\})\s*```'
-				match = re.search(json_pattern, ai_response, re.DOTALL)
+				match = _JSON_BLOCK_RE.search(ai_response)
 				
 				if match:
 					json_str = match.group(1).strip()
-					frappe.logger().info(f"Found JSON in code block: {json_str[:100]}...")
+					logger.info(f"Found JSON in code block: {json_str[:100]}...")
 				else:
 					# Try to extract JSON without code blocks
-					start_idx = ai_response.find("{")
-					end_idx = ai_response.rfind("}") + 1
-					if start_idx != -1 and end_idx > start_idx:
-						json_str = ai_response[start_idx:end_idx].strip()
-						frappe.logger().info(f"Found JSON without code block: {json_str[:100]}...")
-					else:
-						json_str = None
+					json_str = _first_json_object(ai_response)
+					if json_str:
+						logger.info(f"Found JSON without code block: {json_str[:100]}...")
 				
 				if json_str:
-					# Clean up the JSON string
-					json_str = json_str.replace('\n', ' ').replace('\r', '')
-					parsed = json.loads(json_str)
+					try:
+						parsed = json.loads(json_str)
+					except json.JSONDecodeError:
+						# Raw line breaks inside string values are invalid JSON, flatten them and retry
+						json_str = json_str.translate(_JSON_LINE_BREAKS)
+						parsed = json.loads(json_str)
 					
-					frappe.logger().info(f"Parsed JSON structure: {parsed.keys()}")
+					logger.info(f"Parsed JSON structure: {parsed.keys()}")
 					
 					# Check if it has the suggested_action structure
 					if "suggested_action" in parsed:
 						suggested_action = parsed["suggested_action"]
-						frappe.logger().info(f"Extracted suggested_action: {suggested_action}")
+						logger.info(f"Extracted suggested_action: {suggested_action}")
 					elif "action" in parsed:
 						# Already at action level
 						suggested_action = parsed
-						frappe.logger().info(f"Using direct action: {suggested_action}")
+						logger.info(f"Using direct action: {suggested_action}")
 		except json.JSONDecodeError as e:
-			frappe.logger().error(f"JSON decode error: {str(e)}")
-			frappe.logger().error(f"Failed JSON string: {json_str if 'json_str' in locals() else 'N/A'}")
+			logger.error(f"JSON decode error: {str(e)}")
+			logger.error(f"Failed JSON string: {json_str if 'json_str' in locals() else 'N/A'}")
 		except Exception as e:
-			frappe.logger().error(f"Error parsing suggested action: {str(e)}")
+			logger.error(f"Error parsing suggested action: {str(e)}")
 			pass
 		
 		# Calculate response tokens
 		response_tokens = estimate_tokens(ai_response)
 		
 		# Log for debugging
-		frappe.logger().info(f"AI Response length: {len(ai_response)}, Tokens: {response_tokens}")
-		frappe.logger().info(f"Suggested action found: {suggested_action is not None}")
+		logger.info(f"AI Response length: {len(ai_response)}, Tokens: {response_tokens}")
+		logger.info(f"Suggested action found: {suggested_action is not None}")
 		if suggested_action:
-			frappe.logger().info(f"Suggested action details: {json.dumps(suggested_action)}")
+			logger.info(f"Suggested action details: {_dumps_for_log(suggested_action)}")
+		
+		# Summarize each message in one pass over the content
+		messages_summary = []
+		for msg, tokens in zip(messages, msg_tokens):
+			content = msg["content"]
+			content_length = len(content)
+			messages_summary.append({
+				"role": msg["role"],
+				"content_preview": content[:200] + "..." if content_length > 200 else content,
+				"content_length": content_length,
+				"tokens": tokens
+			})
 		
 		# Prepare prompt info for frontend logging
 		prompt_info = {
 			"detected_doctypes": detected_doctypes,
 			"total_messages": len(messages),
 			"history_count": len(history),
-			"system_prompt_preview": system_prompt[:500] + "..." if len(system_prompt) > 500 else system_prompt,
 			"system_prompt_length": len(system_prompt),
-			"system_prompt_tokens": estimate_tokens(system_prompt),
-			"messages_summary": [
-				{
-					"role": msg.get("role"),
-					"content_preview": msg.get("content", "")[:200] + "..." if len(msg.get("content", "")) > 200 else msg.get("content", ""),
-					"content_length": len(msg.get("content", "")),
-					"tokens": estimate_tokens(msg.get("content", ""))
-				}
-				for msg in messages
-			],
-			"full_messages": messages  # Include full messages for detailed inspection
+			"system_prompt_tokens": system_tokens,
+			"messages_summary": messages_summary
 		}
 		
+		# The system prompt and full message array are only returned for debugging (?debug=1)
+		if frappe.form_dict.get("debug"):
+			prompt_info["system_prompt_preview"] = system_prompt[:500] + "..." if len(system_prompt) > 500 else system_prompt
+			prompt_info["full_messages"] = messages
+		
 		return {
 			"status": "success",
 			"message": ai_response,
@@ -795,6 +1236,78 @@ def clear_chat_history():
 		}
 
 
+# Common ERPNext doctypes, served as-is by get_available_doctypes
+_AVAILABLE_DOCTYPES = (
+	{
+		"name": "Customer",
+		"label": "Customer",
+		"module": "CRM",
+		"required_fields": ["customer_name"]
+	},
+	{
+		"name": "Supplier",
+		"label": "Supplier",
+		"module": "Buying",
+		"required_fields": ["supplier_name"]
+	},
+	{
+		"name": "Item",
+		"label": "Item",
+		"module": "Stock",
+		"required_fields": ["item_code", "item_name", "item_group"]
+	},
+	{
+		"name": "Sales Invoice",
+		"label": "Sales Invoice",
+		"module": "Accounts",
+		"required_fields": ["customer", "items"]
+	},
+	{
+		"name": "Purchase Invoice",
+		"label": "Purchase Invoice",
+		"module": "Accounts",
+		"required_fields": ["supplier", "items"]
+	},
+	{
+		"name": "Sales Order",
+		"label": "Sales Order",
+		"module": "Selling",
+		"required_fields": ["customer", "items"]
+	},
+	{
+		"name": "Purchase Order",
+		"label": "Purchase Order",
+		"module": "Buying",
+		"required_fields": ["supplier", "items"]
+	},
+	{
+		"name": "Quotation",
+		"label": "Quotation",
+		"module": "Selling",
+		"required_fields": ["party_name", "items"]
+	},
+	{
+		"name": "Lead",
+		"label": "Lead",
+		"module": "CRM",
+		"required_fields": ["lead_name"]
+	},
+	{
+		"name": "Employee",
+		"label": "Employee",
+		"module": "HR",
+		"required_fields": ["first_name"]
+	}
+)
+
+# Doctypes get_document_details will read: the ones advertised to the AI plus every registered handler
+_ALLOWED_DOCTYPES = frozenset(d["name"] for d in _AVAILABLE_DOCTYPES) | frozenset(DOCTYPE_HANDLERS)
+
+# Document names: at most 140 chars (Frappe's name length), no control characters,
+# no LIKE wildcard or escape characters (the handlers fall back to LIKE lookups on the name)
+_DOC_NAME_RE = re.compile(r"^[^\x00-\x1f\x7f%\\]{1,140}$")
+
+
 @frappe.whitelist(allow_guest=True, methods=["GET"])
 def get_available_doctypes():
 	"""
@@ -803,82 +1316,10 @@ def get_available_doctypes():
 	API Endpoint: /api/method/exim_backend.api.ai_chat.get_available_doctypes
 	Returns: List of doctypes with metadata
 	"""
-	try:
-		# Common ERPNext doctypes
-		doctypes = [
-			{
-				"name": "Customer",
-				"label": "Customer",
-				"module": "CRM",
-				"required_fields": ["customer_name"]
-			},
-			{
-				"name": "Supplier",
-				"label": "Supplier",
-				"module": "Buying",
-				"required_fields": ["supplier_name"]
-			},
-			{
-				"name": "Item",
-				"label": "Item",
-				"module": "Stock",
-				"required_fields": ["item_code", "item_name", "item_group"]
-			},
-			{
-				"name": "Sales Invoice",
-				"label": "Sales Invoice",
-				"module": "Accounts",
-				"required_fields": ["customer", "items"]
-			},
-			{
-				"name": "Purchase Invoice",
-				"label": "Purchase Invoice",
-				"module": "Accounts",
-				"required_fields": ["supplier", "items"]
-			},
-			{
-				"name": "Sales Order",
-				"label": "Sales Order",
-				"module": "Selling",
-				"required_fields": ["customer", "items"]
-			},
-			{
-				"name": "Purchase Order",
-				"label": "Purchase Order",
-				"module": "Buying",
-				"required_fields": ["supplier", "items"]
-			},
-			{
-				"name": "Quotation",
-				"label": "Quotation",
-				"module": "Selling",
-				"required_fields": ["party_name", "items"]
-			},
-			{
-				"name": "Lead",
-				"label": "Lead",
-				"module": "CRM",
-				"required_fields": ["lead_name"]
-			},
-			{
-				"name": "Employee",
-				"label": "Employee",
-				"module": "HR",
-				"required_fields": ["first_name"]
-			}
-		]
-		
-		return {
-			"status": "success",
-			"doctypes": doctypes
-		}
-		
-	except Exception as e:
-		frappe.log_error(f"Get doctypes error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"An error occurred: {str(e)}"
-		}
+	return {
+		"status": "success",
+		"doctypes": _AVAILABLE_DOCTYPES
+	}
 
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
@@ -897,10 +1338,7 @@ def create_document():
 		fields_json = frappe.form_dict.get("fields")
 		
 		if not doctype:
-			return {
-				"status": "error",
-				"message": "DocType is required"
-			}
+			return _ERR_DOCTYPE_REQUIRED
 		
 		if not fields_json:
 			return {
@@ -915,8 +1353,7 @@ def create_document():
 			fields = fields_json
 		
 		# Get handler for this doctype
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler(doctype)
+		handler = _handler(doctype)
 		
 		if handler:
 			# Use handler to create document
@@ -1002,14 +1439,14 @@ def prepare_customer_data(fields):
 		fields["customer_type"] = "Individual" if not fields.get("company") else "Company"
 	
 	if not fields.get("customer_group"):
-		fields["customer_group"] = frappe.db.get_single_value("Selling Settings", "customer_group") or "Individual"
+		fields["customer_group"] = _single_value("Selling Settings", "customer_group") or "Individual"
 	
 	if not fields.get("territory"):
-		fields["territory"] = frappe.db.get_single_value("Selling Settings", "territory") or "All Territories"
+		fields["territory"] = _single_value("Selling Settings", "territory") or "All Territories"
 	
 	# Set default currency if not provided
 	if not fields.get("default_currency"):
-		fields["default_currency"] = frappe.db.get_single_value("System Settings", "currency") or "USD"
+		fields["default_currency"] = _single_value("System Settings", "currency") or "USD"
 	
 	# Map common field names
 	field_mapping = {
@@ -1034,7 +1471,7 @@ def prepare_customer_data(fields):
 def prepare_supplier_data(fields):
 	"""Prepare supplier data with required fields."""
 	if not fields.get("supplier_group"):
-		fields["supplier_group"] = frappe.db.get_single_value("Buying Settings", "supplier_group") or "All Supplier Groups"
+		fields["supplier_group"] = _single_value("Buying Settings", "supplier_group") or "All Supplier Groups"
 	
 	if not fields.get("supplier_type"):
 		fields["supplier_type"] = "Company"
@@ -1056,10 +1493,10 @@ def prepare_supplier_data(fields):
 def prepare_item_data(fields):
 	"""Prepare item data with required fields."""
 	if not fields.get("item_group"):
-		fields["item_group"] = frappe.db.get_single_value("Stock Settings", "item_group") or "All Item Groups"
+		fields["item_group"] = _single_value("Stock Settings", "item_group") or "All Item Groups"
 	
 	if not fields.get("stock_uom"):
-		fields["stock_uom"] = frappe.db.get_single_value("Stock Settings", "stock_uom") or "Nos"
+		fields["stock_uom"] = _single_value("Stock Settings", "stock_uom") or "Nos"
 	
 	# Set item code if not provided
 	if not fields.get("item_code"):
@@ -1103,7 +1540,7 @@ def search_customers():
 	"""
 	try:
 		query = frappe.form_dict.get("query", "").strip()
-		limit = int(frappe.form_dict.get("limit", 10))
+		limit = _int_arg("limit", 10)
 		
 		if not query:
 			return {
@@ -1112,38 +1549,7 @@ def search_customers():
 			}
 		
 		# Search customers by name, email, or mobile
-		customers = frappe.db.sql("""
-			SELECT 
-				name,
-				customer_name,
-				customer_type,
-				mobile_no,
-				email_id,
-				customer_primary_contact,
-				territory,
-				customer_group,
-				default_currency,
-				default_price_list,
-				creation,
-				modified
-			FROM `tabCustomer`
-			WHERE 
-				customer_name LIKE %(search)s
-				OR mobile_no LIKE %(search)s
-				OR email_id LIKE %(search)s
-				OR name LIKE %(search)s
-			ORDER BY modified DESC
-			LIMIT %(limit)s
-		""", {
-			"search": f"%{query}%",
-			"limit": limit
-		}, as_dict=True)
-		
-		return {
-			"status": "success",
-			"count": len(customers),
-			"customers": customers
-		}
+		return _handler("Customer").search_by_query(query, limit)
 		
 	except Exception as e:
 		frappe.logger().error(f"Customer search error: {str(e)}")
@@ -1174,7 +1580,7 @@ def get_doctype_fields():
 			}
 		
 		# Get doctype meta
-		meta = frappe.get_meta(doctype)
+		meta = _cached_meta(doctype)
 		
 		# Extract field information
 		fields_info = []
@@ -1195,7 +1601,7 @@ def get_doctype_fields():
 			
 			# If it's a Table field (child table), get its structure
 			if field.fieldtype == "Table" and field.options:
-				child_meta = frappe.get_meta(field.options)
+				child_meta = _cached_meta(field.options)
 				child_fields = []
 				
 				for child_field in child_meta.fields:
@@ -1256,14 +1662,11 @@ def dynamic_search():
 	try:
 		doctype = frappe.form_dict.get("doctype")
 		filters_json = frappe.form_dict.get("filters")
-		limit = int(frappe.form_dict.get("limit", 20))
+		limit = _int_arg("limit", 20)
 		order_by = frappe.form_dict.get("order_by", "modified desc")
 		
 		if not doctype:
-			return {
-				"status": "error",
-				"message": "DocType is required"
-			}
+			return _ERR_DOCTYPE_REQUIRED
 		
 		# Parse filters (allow empty filters for sorting-only queries)
 		filters = {}
@@ -1274,8 +1677,7 @@ def dynamic_search():
 				filters = filters_json
 		
 		# Get handler for this doctype
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler(doctype)
+		handler = _handler(doctype)
 		
 		if handler:
 			# Check for special aggregation queries for Sales Order
@@ -1311,8 +1713,7 @@ def dynamic_search():
 				
 				# If we have a sales person filter, use SalesPersonHandler
 				if sales_person_filter:
-					from exim_backend.api.doctypes import get_handler
-					sales_person_handler = get_handler("Sales Person")
+					sales_person_handler = _handler("Sales Person")
 					if sales_person_handler and hasattr(sales_person_handler, 'get_sales_orders_for_sales_person'):
 						result = sales_person_handler.get_sales_orders_for_sales_person(
 							sales_person_filter,
@@ -1327,18 +1728,12 @@ def dynamic_search():
 				if "customer_group" in filters:
 					customer_group = filters.pop("customer_group")
 					if hasattr(handler, 'get_orders_by_customer_group'):
-						result = handler.get_orders_by_customer_group(customer_group)
-						if "results" in result:
-							result["sales_orders"] = result.pop("results")
-						return result
+						return handler.get_orders_by_customer_group(customer_group)
 				# Handle territory filter (requires join with Customer)
 				if "territory" in filters:
 					territory = filters.pop("territory")
 					if hasattr(handler, 'get_orders_by_territory'):
-						result = handler.get_orders_by_territory(territory)
-						if "results" in result:
-							result["sales_orders"] = result.pop("results")
-						return result
+						return handler.get_orders_by_territory(territory)
 			
 			result = handler.dynamic_search(filters, limit, order_by)
 			# Rename 'results' to doctype-specific name for backward compatibility
@@ -1386,14 +1781,10 @@ def find_duplicates():
 		doctype = frappe.form_dict.get("doctype")
 		
 		if not doctype:
-			return {
-				"status": "error",
-				"message": "DocType is required"
-			}
+			return _ERR_DOCTYPE_REQUIRED
 		
 		# Get handler for this doctype
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler(doctype)
+		handler = _handler(doctype)
 		
 		if handler and hasattr(handler, 'find_duplicates'):
 			return handler.find_duplicates()
@@ -1437,10 +1828,7 @@ def count_documents():
 		filters_json = frappe.form_dict.get("filters")
 		
 		if not doctype:
-			return {
-				"status": "error",
-				"message": "DocType is required"
-			}
+			return _ERR_DOCTYPE_REQUIRED
 		
 		# Parse filters if provided
 		filters = None
@@ -1451,8 +1839,7 @@ def count_documents():
 				filters = filters_json
 		
 		# Get handler for this doctype
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler(doctype)
+		handler = _handler(doctype)
 		
 		if handler:
 			# Special handling for Sales Order with sales_team/sales_person filter
@@ -1488,7 +1875,7 @@ def count_documents():
 				
 				# If we have a sales person filter, use SalesPersonHandler
 				if sales_person_filter:
-					sales_person_handler = get_handler("Sales Person")
+					sales_person_handler = _handler("Sales Person")
 					if sales_person_handler and hasattr(sales_person_handler, 'count_sales_orders_for_sales_person'):
 						# Create filters dict without sales_team/sales_person
 						remaining_filters = {k: v for k, v in (filters or {}).items() if k not in ["sales_team", "sales_person"]}
@@ -1552,8 +1939,7 @@ def get_sales_person_count():
 	Returns: Sales person count
 	"""
 	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Person")
+		handler = _handler("Sales Person")
 		
 		if handler:
 			filters_json = frappe.form_dict.get("filters")
@@ -1590,8 +1976,7 @@ def get_sales_person_names():
 	Returns: List of sales person names with details
 	"""
 	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Person")
+		handler = _handler("Sales Person")
 		
 		if handler:
 			filters_json = frappe.form_dict.get("filters")
@@ -1640,8 +2025,7 @@ def get_sales_person_summary():
 	Returns: Comprehensive summary with all metrics
 	"""
 	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Person")
+		handler = _handler("Sales Person")
 		
 		if handler:
 			sales_person = frappe.form_dict.get("sales_person")
@@ -1682,10 +2066,9 @@ def get_all_sales_persons_summary():
 	Returns: Table data with all sales persons and their summaries
 	"""
 	try:
-		from exim_backend.api.doctypes import get_handler
 		from frappe.utils import today, add_days
 		
-		handler = get_handler("Sales Person")
+		handler = _handler("Sales Person")
 		
 		if handler:
 			from_date = frappe.form_dict.get("from_date")
@@ -1721,7 +2104,8 @@ def get_all_sales_persons_summary():
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_customers_by_order_count():
+@api_endpoint("Sales Order", "get_customers_by_order_count")
+def get_customers_by_order_count(method):
 	"""
 	Get customers with most orders, ordered by order count.
 	
@@ -1731,29 +2115,14 @@ def get_customers_by_order_count():
 		- order_by: Order by clause (default: order_count desc)
 	Returns: Customers with order counts
 	"""
-	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_customers_by_order_count'):
-			limit = int(frappe.form_dict.get("limit", 10))
-			order_by = frappe.form_dict.get("order_by", "order_count desc")
-			return handler.get_customers_by_order_count(limit, order_by)
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get customers by order count error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get customers by order count: {str(e)}"
-		}
+	limit = _int_arg("limit", 10)
+	order_by = frappe.form_dict.get("order_by", "order_count desc")
+	return method(limit, order_by)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_customers_by_order_value():
+@api_endpoint("Sales Order", "get_customers_by_order_value")
+def get_customers_by_order_value(method):
 	"""
 	Get customers with highest order value, ordered by total value.
 	
@@ -1763,29 +2132,25 @@ def get_customers_by_order_value():
 		- order_by: Order by clause (default: total_value desc)
 	Returns: Customers with order values
 	"""
-	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_customers_by_order_value'):
-			limit = int(frappe.form_dict.get("limit", 10))
-			order_by = frappe.form_dict.get("order_by", "total_value desc")
-			return handler.get_customers_by_order_value(limit, order_by)
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get customers by order value error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get customers by order value: {str(e)}"
-		}
+	limit = _int_arg("limit", 10)
+	order_by = frappe.form_dict.get("order_by", "total_value desc")
+	return _cached_response(
+		("customers_by_order_value", limit, order_by),
+		lambda: method(limit, order_by)
+	)
+
+
+def _required_filter_call(method, param, missing_error):
+	"""Call a Sales Order handler method with the one required form field param, or return missing_error."""
+	value = frappe.form_dict.get(param)
+	if not value:
+		return missing_error
+	return method(value)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_orders_by_customer_group():
+@api_endpoint("Sales Order", "get_orders_by_customer_group")
+def get_orders_by_customer_group(method):
 	"""
 	Get sales orders filtered by customer group.
 	
@@ -1794,38 +2159,12 @@ def get_orders_by_customer_group():
 		- customer_group: Customer group name (required)
 	Returns: Sales orders for customers in the specified group
 	"""
-	try:
-		customer_group = frappe.form_dict.get("customer_group")
-		if not customer_group:
-			return {
-				"status": "error",
-				"message": "Customer group is required"
-			}
-		
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_orders_by_customer_group'):
-			result = handler.get_orders_by_customer_group(customer_group)
-			# Rename 'results' to 'sales_orders' for consistency
-			if "results" in result:
-				result["sales_orders"] = result.pop("results")
-			return result
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get orders by customer group error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get orders by customer group: {str(e)}"
-		}
+	return _required_filter_call(method, "customer_group", _ERR_CUSTOMER_GROUP_REQUIRED)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_orders_by_territory():
+@api_endpoint("Sales Order", "get_orders_by_territory")
+def get_orders_by_territory(method):
 	"""
 	Get sales orders filtered by territory.
 	
@@ -1834,38 +2173,12 @@ def get_orders_by_territory():
 		- territory: Territory name (required)
 	Returns: Sales orders for customers in the specified territory
 	"""
-	try:
-		territory = frappe.form_dict.get("territory")
-		if not territory:
-			return {
-				"status": "error",
-				"message": "Territory is required"
-			}
-		
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_orders_by_territory'):
-			result = handler.get_orders_by_territory(territory)
-			# Rename 'results' to 'sales_orders' for consistency
-			if "results" in result:
-				result["sales_orders"] = result.pop("results")
-			return result
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get orders by territory error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get orders by territory: {str(e)}"
-		}
+	return _required_filter_call(method, "territory", _ERR_TERRITORY_REQUIRED)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_orders_by_item():
+@api_endpoint("Sales Order", "get_orders_by_item")
+def get_orders_by_item(method):
 	"""
 	Get sales orders containing a specific item.
 	
@@ -1874,38 +2187,26 @@ def get_orders_by_item():
 		- item_code: Item code (required)
 	Returns: Sales orders containing the specified item
 	"""
-	try:
-		item_code = frappe.form_dict.get("item_code")
-		if not item_code:
-			return {
-				"status": "error",
-				"message": "Item code is required"
-			}
-		
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_orders_by_item'):
-			result = handler.get_orders_by_item(item_code)
-			# Rename 'results' to 'sales_orders' for consistency
-			if "results" in result:
-				result["sales_orders"] = result.pop("results")
-			return result
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get orders by item error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get orders by item: {str(e)}"
-		}
+	return _required_filter_call(method, "item_code", _ERR_ITEM_CODE_REQUIRED)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_orders_with_most_items():
+@api_endpoint("Sales Order", "get_orders_by_item_group")
+def get_orders_by_item_group(method):
+	"""
+	Get sales orders containing items from a specific item group.
+	
+	API Endpoint: /api/method/exim_backend.api.ai_chat.get_orders_by_item_group
+	Accepts:
+		- item_group: Item group name (required)
+	Returns: Sales orders containing items from the specified group
+	"""
+	return _required_filter_call(method, "item_group", _ERR_ITEM_GROUP_REQUIRED)
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
+@api_endpoint("Sales Order", "get_orders_with_most_items")
+def get_orders_with_most_items(method):
 	"""
 	Get sales orders with most line items.
 	
@@ -1915,114 +2216,71 @@ def get_orders_with_most_items():
 		- order_by: Order by clause (default: item_count desc)
 	Returns: Sales orders with item counts
 	"""
-	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_orders_with_most_items'):
-			limit = int(frappe.form_dict.get("limit", 10))
-			order_by = frappe.form_dict.get("order_by", "item_count desc")
-			result = handler.get_orders_with_most_items(limit, order_by)
-			# Rename 'results' to 'sales_orders' for consistency
-			if "results" in result:
-				result["sales_orders"] = result.pop("results")
-			return result
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get orders with most items error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get orders with most items: {str(e)}"
-		}
+	limit = _int_arg("limit", 10)
+	order_by = frappe.form_dict.get("order_by", "item_count desc")
+	return _cached_response(
+		("orders_with_most_items", limit, order_by),
+		lambda: method(limit, order_by)
+	)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_orders_by_item_group():
+@api_endpoint("Sales Order", "get_total_quantity_sold")
+def get_total_quantity_sold(method):
 	"""
-	Get sales orders containing items from a specific item group.
+	Get total quantity sold for a specific item within a date range.
 	
-	API Endpoint: /api/method/exim_backend.api.ai_chat.get_orders_by_item_group
+	API Endpoint: /api/method/exim_backend.api.ai_chat.get_total_quantity_sold
 	Accepts:
-		- item_group: Item group name (required)
-	Returns: Sales orders containing items from the specified group
+		- item_code: Item code (required)
+		- from_date: Start date (optional)
+		- to_date: End date (optional)
+	Returns: Total quantity and amount sold
 	"""
-	try:
-		item_group = frappe.form_dict.get("item_group")
-		if not item_group:
-			return {
-				"status": "error",
-				"message": "Item group is required"
-			}
-		
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_orders_by_item_group'):
-			result = handler.get_orders_by_item_group(item_group)
-			# Rename 'results' to 'sales_orders' for consistency
-			if "results" in result:
-				result["sales_orders"] = result.pop("results")
-			return result
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get orders by item group error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get orders by item group: {str(e)}"
-		}
+	item_code = frappe.form_dict.get("item_code")
+	if not item_code:
+		return _ERR_ITEM_CODE_REQUIRED
+	
+	from_date = frappe.form_dict.get("from_date")
+	to_date = frappe.form_dict.get("to_date")
+	return method(item_code, from_date, to_date)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_total_quantity_sold():
+@api_endpoint("Sales Order", "get_total_quantity_sold_batch")
+def get_total_quantity_sold_batch(method):
 	"""
-	Get total quantity sold for a specific item within a date range.
+	Get total quantity sold for several items within a date range, in one query.
 	
-	API Endpoint: /api/method/exim_backend.api.ai_chat.get_total_quantity_sold
+	API Endpoint: /api/method/exim_backend.api.ai_chat.get_total_quantity_sold_batch
 	Accepts:
-		- item_code: Item code (required)
+		- item_codes: JSON array of item codes (required)
 		- from_date: Start date (optional)
 		- to_date: End date (optional)
-	Returns: Total quantity and amount sold
+	Returns: Totals per item code
 	"""
-	try:
-		item_code = frappe.form_dict.get("item_code")
-		if not item_code:
-			return {
-				"status": "error",
-				"message": "Item code is required"
-			}
-		
-		from_date = frappe.form_dict.get("from_date")
-		to_date = frappe.form_dict.get("to_date")
-		
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_total_quantity_sold'):
-			return handler.get_total_quantity_sold(item_code, from_date, to_date)
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get total quantity sold error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get total quantity sold: {str(e)}"
-		}
+	item_codes = frappe.form_dict.get("item_codes")
+	if not item_codes:
+		return _ERR_ITEM_CODES_REQUIRED
+	if isinstance(item_codes, str):
+		try:
+			item_codes = json.loads(item_codes)
+		except ValueError:
+			return _ERR_INVALID_ITEM_CODES
+	# Only a list of strings may reach the IN parameter (a bare string would be split into characters)
+	if not isinstance(item_codes, list) or not all(isinstance(code, str) and code for code in item_codes):
+		return _ERR_INVALID_ITEM_CODES
+	if not item_codes:
+		return _ERR_ITEM_CODES_REQUIRED
+	
+	from_date = frappe.form_dict.get("from_date")
+	to_date = frappe.form_dict.get("to_date")
+	return method(item_codes, from_date, to_date)
 
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
-def get_most_sold_items():
+@api_endpoint("Sales Order", "get_most_sold_items")
+def get_most_sold_items(method):
 	"""
 	Get most sold items aggregated by item_code.
 	
@@ -2034,27 +2292,14 @@ def get_most_sold_items():
 		- to_date: End date (optional)
 	Returns: Most sold items with quantities and amounts
 	"""
-	try:
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler("Sales Order")
-		
-		if handler and hasattr(handler, 'get_most_sold_items'):
-			limit = int(frappe.form_dict.get("limit", 10))
-			order_by = frappe.form_dict.get("order_by", "total_qty desc")
-			from_date = frappe.form_dict.get("from_date")
-			to_date = frappe.form_dict.get("to_date")
-			return handler.get_most_sold_items(limit, order_by, from_date, to_date)
-		else:
-			return {
-				"status": "error",
-				"message": "Handler or method not available"
-			}
-	except Exception as e:
-		frappe.logger().error(f"Get most sold items error: {str(e)}")
-		return {
-			"status": "error",
-			"message": f"Failed to get most sold items: {str(e)}"
-		}
+	limit = _int_arg("limit", 10)
+	order_by = frappe.form_dict.get("order_by", "total_qty desc")
+	from_date = frappe.form_dict.get("from_date")
+	to_date = frappe.form_dict.get("to_date")
+	return _cached_response(
+		("most_sold_items", limit, order_by, from_date, to_date),
+		lambda: method(limit, order_by, from_date, to_date)
+	)
 
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
@@ -2073,44 +2318,59 @@ def get_document_details():
 		name = frappe.form_dict.get("name", "").strip()
 		
 		if not doctype:
-			return {
-				"status": "error",
-				"message": "DocType is required"
-			}
+			return _ERR_DOCTYPE_REQUIRED
 		
 		if not name:
+			return _ERR_DOC_NAME_REQUIRED
+		
+		if doctype not in _ALLOWED_DOCTYPES:
 			return {
 				"status": "error",
-				"message": "Document name is required"
+				"message": f"Unsupported doctype: {doctype}"
 			}
 		
+		if not _DOC_NAME_RE.match(name):
+			return _ERR_INVALID_DOC_NAME
+		
 		# Get handler for this doctype
-		from exim_backend.api.doctypes import get_handler
-		handler = get_handler(doctype)
+		handler = _handler(doctype)
 		
 		if handler:
-			result = handler.get_document_details(name)
-			frappe.logger().info(f"Handler returned result for {doctype} '{name}': status={result.get('status')}, keys={list(result.keys())}")
+			logger = frappe.logger()
+			log_info = logger.isEnabledFor(logging.INFO)
+			
+			# Read-only projection for the AI, no need to build the Document
+			result = handler.get_document_details(name, lightweight=True)
+			if log_info:
+				logger.info("Handler returned result for %s '%s': status=%s, keys=%s", doctype, name, result.get("status"), list(result))
 			
 			# Rename 'document' to doctype-specific name for backward compatibility
 			if "document" in result:
 				# Use lowercase doctype as key (customer, item, etc.)
 				doctype_key = doctype.lower()
 				result[doctype_key] = result.pop("document")
-				frappe.logger().info(f"Renamed 'document' to '{doctype_key}'")
+				if log_info:
+					logger.info("Renamed 'document' to '%s'", doctype_key)
 			
 			# Log the final result structure
-			frappe.logger().info(f"Final API response for {doctype} '{name}': {json.dumps({k: type(v).__name__ if not isinstance(v, (str, int, float, bool, type(None))) else v for k, v in result.items()}, indent=2)}")
+			if log_info:
+				logger.info(
+					"Final API response for %s '%s': %s",
+					doctype,
+					name,
+					json.dumps({k: type(v).__name__ if not isinstance(v, (str, int, float, bool, type(None))) else v for k, v in result.items()}, indent=2)
+				)
 			return result
 		else:
-			# Fallback to generic retrieval
-			if not frappe.db.exists(doctype, name):
+			# Fallback to generic retrieval (get_doc raises DoesNotExistError for missing documents)
+			try:
+				doc = frappe.get_doc(doctype, name)
+			except frappe.DoesNotExistError:
 				return {
 					"status": "error",
 					"message": f"{doctype} '{name}' not found"
 				}
 			
-			doc = frappe.get_doc(doctype, name)
 			return {
 				"status": "success",
 				"document": doc.as_dict()
@@ -2136,35 +2396,41 @@ def get_customer_details():
 	return get_document_details()
 
 
+# OCR output shorter than this (after stripping) is not worth an AI round-trip
+_MIN_ANALYZE_CHARS = 20
+
+# Prompt used by analyze_image_with_ai, {text} is the OCR output
+_ANALYSIS_PROMPT_TMPL = """Analyze this text extracted from an image and identify:
+1. What type of document it appears to be
+2. Which ERPNext DocType would be appropriate (Customer, Item, Sales Invoice, etc.)
+3. What fields can be extracted and their values
+
+Extracted text:
+{text}
+
+Provide a structured analysis."""
+
+
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def analyze_image_with_ai():
 	"""
 	Extract text from image and analyze it with Gemini AI.
 	
 	API Endpoint: /api/method/exim_backend.api.ai_chat.analyze_image_with_ai
-	Accepts: image (file)
+	Accepts: image (file, may be repeated to analyze several pages together)
 	Returns: Extracted text and AI analysis
 	"""
 	try:
-		image_file = frappe.request.files.get("image")
-		if not image_file:
+		image_files = frappe.request.files.getlist("image")
+		if not image_files:
 			return {
 				"status": "error",
 				"message": "Please upload an image file"
 			}
 		
-		# Save temporarily and extract text
-		temp_path = frappe.get_site_path("public", "temp")
-		os.makedirs(temp_path, exist_ok=True)
-		filepath = os.path.join(temp_path, image_file.filename)
-		image_file.save(filepath)
-		
-		# Extract text using OCR
-		from pytesseract import image_to_string
-		extracted_text = image_to_string(Image.open(filepath))
-		
-		# Cleanup
-		os.remove(filepath)
+		# Extract text using OCR, all images in parallel off the request thread
+		ocr_futures = [_OCR_POOL.submit(_ocr_bytes, image_file.read()) for image_file in image_files]
+		extracted_text = "\n\n".join(future.result() for future in ocr_futures)
 		
 		if not extracted_text.strip():
 			return {
@@ -2173,17 +2439,16 @@ def analyze_image_with_ai():
 				"message": "No text found in image"
 			}
 		
-		# Analyze with AI
+		if len(extracted_text.strip()) < _MIN_ANALYZE_CHARS:
+			return {
+				"status": "success",
+				"extracted_text": extracted_text,
+				"message": "Insufficient text for analysis"
+			}
+		
+		# Analyze with AI (configuration is checked after the input, so input errors are reported first)
 		config = get_ai_config()
-		analysis_prompt = f"""Analyze this text extracted from an image and identify:
-1. What type of document it appears to be
-2. Which ERPNext DocType would be appropriate (Customer, Item, Sales Invoice, etc.)
-3. What fields can be extracted and their values
-
-Extracted text:
-{extracted_text}
-
-Provide a structured analysis."""
+		analysis_prompt = _ANALYSIS_PROMPT_TMPL.format(text=extracted_text)
 		
 		analysis = call_ai_api(analysis_prompt, config)
 		
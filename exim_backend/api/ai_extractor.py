@@ -3,18 +3,330 @@ AI Sales Order Extractor.
 Uses AI models to extract and structure sales order data from PDF content.
 """
 
-import copy
 import frappe
+import functools
+import hashlib
 import json
 import re
+import requests
+import time
+from datetime import date
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any
+from urllib3.util.retry import Retry
+
+try:
+	from pydantic import BaseModel, ConfigDict, field_validator
+except ImportError:
+	BaseModel = None
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import pandas as pd
+except ImportError:
+	pd = None
+
+try:
+	import tiktoken
+except ImportError:
+	tiktoken = None
+
+try:
+	from dateutil import parser as date_parser
+except ImportError:
+	date_parser = None
+
+# Patterns used by the rule-based fallback extraction
+_CUSTOMER_RE = re.compile(r'(?:Customer|Client|Bill To|Sold To)[:\s]+([^\n]+)', re.IGNORECASE)
+_DATE_ANY_RE = re.compile(r'\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b')
+_PO_RE = re.compile(r'(?:PO|Purchase Order)[#:\s]+([A-Z0-9\-]+)', re.IGNORECASE)
+_QTY_RE = re.compile(r'(\d+(?:\.\d+)?)')
+_RATE_RE = re.compile(r'(\d+(?:,\d{3})*(?:\.\d+)?)')
+_ITEM_LINE_RE = re.compile(
+	r'(?:Item|Product)[:\s]+([^\n,]+)[^\n]*?(?:Qty|Quantity)[:\s]+(\d+(?:\.\d+)?)[^\n]*?(?:Rate|Price)[:\s]+(\d+(?:\.\d+)?)',
+	re.IGNORECASE
+)
+_HEADER_WS_RE = re.compile(r'\s+')
+# Numeric dates with a 4-digit year first (YYYY-MM-DD) or last (MM-DD-YYYY / DD-MM-YYYY)
+_DATE_NUMERIC_RE = re.compile(
+	r'^\s*(?:(\d{4})[-/](\d{1,2})[-/](\d{1,2})|(\d{1,2})[-/](\d{1,2})[-/](\d{4}))\s*$'
+)
+# Optional ```json / ``` fences around an AI response, group 1 is the payload (always matches)
+_FENCE_RE = re.compile(r'^\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```\s*)?$', re.DOTALL)
+
+# Lowercase header keywords locating the item, quantity and rate columns of a table
+_ITEM_KEYS = ("item", "product", "description", "part")
+_QTY_KEYS = ("qty", "quantity", "qnty")
+_RATE_KEYS = ("rate", "price", "unit price", "amount")
+
+# Tables with at least this many rows are parsed column-wise with pandas (when installed),
+# below it building the DataFrame costs more than the row loop
+_VECTORIZE_MIN_ROWS = 50
+
+# PDF text budget of the extraction prompt, in tokens (site config: ai_max_input_tokens).
+# Counted with tiktoken when installed, otherwise estimated at 4 characters per token.
+_DEFAULT_MAX_INPUT_TOKENS = 6000
+_TOKEN_ENCODING = "cl100k_base"
+_CHARS_PER_TOKEN = 4
+
+# Static parts of the extraction prompt built by _build_extraction_prompt
+_PROMPT_HEADER = """
+Extract sales order information from the following PDF content and return it as a JSON object.
+
+**PDF Content:**
+
+"""
+_PROMPT_SCHEMA = """
+
+**Required JSON Format:**
+{
+  "customer": "customer_id_or_name",
+  "customer_name": "customer display name",
+  "transaction_date": "YYYY-MM-DD",
+  "delivery_date": "YYYY-MM-DD",
+  "po_no": "purchase order number",
+  "po_date": "YYYY-MM-DD",
+  "company": "company name",
+  "items": [
+    {
+      "item_code": "item code or name",
+      "item_name": "item description",
+      "qty": 10,
+      "rate": 100.00,
+      "uom": "unit of measure"
+    }
+  ]
+}
+
+**Instructions:**
+1. Extract customer information (name, ID if available)
+2. Extract all dates in YYYY-MM-DD format
+3. Extract each line item with: item code/name, quantity, rate/price
+4. If UOM (unit of measure) is mentioned, include it
+5. Extract PO number and date if available
+6. Return ONLY valid JSON, no markdown formatting
+7. If a field is not found, use null
+
+Please extract and return the JSON:
+"""
+
+# Shared HTTP session: keeps the TLS connection to the AI provider alive between extractions.
+# POST is retried too, only on rate limiting and gateway errors.
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(
+	pool_connections=8,
+	pool_maxsize=8,
+	max_retries=Retry(
+		total=2,
+		backoff_factor=0.5,
+		status_forcelist=(429, 500, 502, 503, 504),
+		allowed_methods=frozenset({"POST"}),
+		raise_on_status=False
+	)
+))
+
+# Malformed AI output is sent back to the model with the error this many times before giving up
+_JSON_RETRIES = 2
+_JSON_RETRY_BACKOFF = 1.0
+
+_JSON_RETRY_FEEDBACK = (
+	"Your previous output could not be used: {error}\n"
+	"Fix it and return ONLY the corrected JSON, no markdown formatting."
+)
+
+if BaseModel:
+	def _number_as_text(value):
+		"""Models often emit item codes / PO numbers as JSON numbers, keep them as text (1001.0 -> "1001")."""
+		if isinstance(value, bool):
+			return value
+		if isinstance(value, float) and value.is_integer():
+			return str(int(value))
+		if isinstance(value, (int, float)):
+			return str(value)
+		return value
+	
+	def _none_as_empty_list(value):
+		"""The prompt asks for null when a field is not found, for items that means no items."""
+		return [] if value is None else value
+	
+	class SalesOrderItemModel(BaseModel):
+		"""One line item of the extraction JSON format."""
+		model_config = ConfigDict(extra="allow")
+		
+		item_code: str | None = None
+		item_name: str | None = None
+		qty: float | None = None
+		rate: float | None = None
+		uom: str | None = None
+		
+		_text_fields = field_validator("item_code", "item_name", "uom", mode="before")(_number_as_text)
+	
+	class SalesOrderModel(BaseModel):
+		"""Extraction JSON format requested by _build_extraction_prompt."""
+		model_config = ConfigDict(extra="allow")
+		
+		customer: str | None = None
+		customer_name: str | None = None
+		transaction_date: str | None = None
+		delivery_date: str | None = None
+		po_no: str | None = None
+		po_date: str | None = None
+		company: str | None = None
+		items: list[SalesOrderItemModel] = []
+		
+		_text_fields = field_validator(
+			"customer", "customer_name", "transaction_date", "delivery_date", "po_no", "po_date", "company",
+			mode="before"
+		)(_number_as_text)
+		_items_list = field_validator("items", mode="before")(_none_as_empty_list)
+else:
+	SalesOrderModel = None
+
+# Key snippet categories, checked in this order (the first category with a matching term wins)
+_SNIPPET_KEYWORDS = {
+	"Customer": ["customer", "client", "bill to", "sold to", "ship to"],
+	"PO": ["purchase order", "po#", "po no", "order no", "quote no"],
+	"Dates": ["date", "delivery", "ship date", "due date"],
+	"Totals": ["total", "subtotal", "amount", "balance"]
+}
+# Flattened (term, category) pairs in category order: the first term found in a line
+# belongs to the first category with a match. Plain substring tests on the lowercased line
+# measured several times faster than a compiled alternation with per-category lookaheads.
+_SNIPPET_TERMS = tuple((term, label) for label, terms in _SNIPPET_KEYWORDS.items() for term in terms)
+
+# Raw AI extractions are cached in Redis by a hash of provider, model and prompt, bump the version
+# to invalidate every entry. Cached data is re-structured on recall like a fresh response.
+_EXTRACTION_CACHE_VERSION = "v1"
+_EXTRACTION_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Models used when site config has no ai_model
+_OPENROUTER_DEFAULT_MODEL = "google/gemini-2.0-flash-exp:free"
+_GEMINI_DEFAULT_MODEL = "gemini-1.5-flash"
+
+# Fields _merge_with_fallback_data can fill from the rule-based extraction
+_MERGE_HEADER_FIELDS = ("customer", "transaction_date", "delivery_date", "po_no", "po_date", "company")
+_MERGE_ITEM_FIELDS = ("item_code", "item_name", "qty", "rate", "uom")
+# Item fields the rule-based extraction can produce (it never finds a UOM)
+_FALLBACK_ITEM_FIELDS = ("item_code", "item_name", "qty", "rate")
+
+
+# Site config keys read by the extractor
+_AI_CONFIG_KEYS = (
+	"openrouter_api_key",
+	"gemini_api_key",
+	"ai_model",
+	"ai_extract_disable_cache",
+	"ai_max_input_tokens",
+)
+
+# _AI_CONFIG_KEYS values keyed by site -> (expires_at, config). The TTL bounds how long a
+# process keeps serving old keys: the clear_cache hook only resets the process running it.
+_AI_CONFIG_CACHE = {}
+_AI_CONFIG_TTL = 300
+
+
+def _ai_config():
+	"""
+	Extractor settings from site config, memoized per site for _AI_CONFIG_TTL seconds.
+	Also reset by clear_module_caches (clear_cache hook).
+	"""
+	cached = _AI_CONFIG_CACHE.get(frappe.local.site)
+	now = time.monotonic()
+	if cached and cached[0] > now:
+		return cached[1]
+	config = {key: frappe.conf.get(key) for key in _AI_CONFIG_KEYS}
+	_AI_CONFIG_CACHE[frappe.local.site] = (now + _AI_CONFIG_TTL, config)
+	return config
+
+
+def clear_module_caches():
+	"""Reset process-level caches of this module. Wired to the clear_cache hook."""
+	_AI_CONFIG_CACHE.clear()
+
+
+def _is_missing(value):
+	"""True for None, blank strings and empty lists."""
+	if value is None:
+		return True
+	if isinstance(value, str) and not value.strip():
+		return True
+	if isinstance(value, list) and len(value) == 0:
+		return True
+	return False
+
+
+def _strip_code_fence(content):
+	"""Remove a markdown code fence around an AI response."""
+	return _FENCE_RE.match(content).group(1)
+
+
+def _parse_extraction(content):
+	"""
+	Parse an AI extraction response. It is validated against SalesOrderModel
+	(when pydantic is installed), keeping only the keys the model actually returned.
+	Raises ValueError (JSONDecodeError / pydantic ValidationError) on unusable output.
+	"""
+	content = _strip_code_fence(content)
+	if not SalesOrderModel:
+		# orjson.JSONDecodeError subclasses ValueError like json's
+		return orjson.loads(content) if orjson else json.loads(content)
+	return SalesOrderModel.model_validate_json(content).model_dump(exclude_unset=True)
+
+
+@functools.lru_cache(maxsize=1)
+def _token_encoding():
+	"""tiktoken encoding for prompt budgeting, None when unavailable (not installed or BPE file not loadable)."""
+	if not tiktoken:
+		return None
+	try:
+		return tiktoken.get_encoding(_TOKEN_ENCODING)
+	except Exception as e:
+		frappe.logger().warning(f"tiktoken encoding unavailable, estimating tokens: {str(e)}")
+		return None
+
+
+def _truncate_to_tokens(text, max_tokens):
+	"""Return (longest prefix of text within max_tokens, whether it was cut)."""
+	encoding = _token_encoding()
+	if encoding is None:
+		max_chars = max_tokens * _CHARS_PER_TOKEN
+		return text[:max_chars], len(text) > max_chars
+	
+	tokens = encoding.encode(text, disallowed_special=())
+	if len(tokens) <= max_tokens:
+		return text, False
+	return encoding.decode(tokens[:max_tokens]), True
+
+
+@functools.lru_cache(maxsize=8)
+def _openrouter_headers(api_key):
+	"""OpenRouter request headers, built once per API key."""
+	return {
+		"Authorization": f"Bearer {api_key}",
+		"Content-Type": "application/json",
+		"HTTP-Referer": "https://erp.local",  # Optional
+		"X-Title": "ERPNext PDF Extractor"    # Optional
+	}
+
+
+@functools.lru_cache(maxsize=8)
+def _gemini_model(api_key, model_name):
+	"""Configured Gemini model, reused across extractions (its client keeps its connection)."""
+	import google.generativeai as genai
+	
+	genai.configure(api_key=api_key)
+	return genai.GenerativeModel(model_name)
 
 
 class AISalesOrderExtractor:
 	"""Uses AI to extract structured sales order data from PDF content."""
 	
-	def __init__(self):
-		self.extraction_prompt_template = self._get_extraction_prompt()
+	# Stateless: prompts and provider settings live at module level
+	__slots__ = ()
 	
 	def extract_sales_order_data(self, pdf_content):
 		"""
@@ -42,14 +354,7 @@ class AISalesOrderExtractor:
 				}
 			
 			# Parse and validate the extracted data
-			extracted_data = extraction_result.get("data", {})
-			structured_data = self._structure_sales_order_data(extracted_data)
-			structured_data = self._merge_with_fallback_data(structured_data, formatted_content)
-			
-			return {
-				"status": "success",
-				"data": structured_data
-			}
+			return self._build_extraction_result(extraction_result.get("data", {}), formatted_content)
 			
 		except Exception as e:
 			frappe.logger().error(f"Error in AI extraction: {str(e)}")
@@ -59,6 +364,16 @@ class AISalesOrderExtractor:
 				"message": f"AI extraction failed: {str(e)}"
 			}
 	
+	def _build_extraction_result(self, extracted_data, formatted_content):
+		"""Structure raw AI output, fill gaps from the rule-based extraction and wrap it in the result envelope."""
+		structured_data = self._structure_sales_order_data(extracted_data)
+		structured_data = self._merge_with_fallback_data(structured_data, formatted_content)
+		
+		return {
+			"status": "success",
+			"data": structured_data
+		}
+	
 	def _format_content_for_ai(self, pdf_content):
 		"""
 		Format PDF content into a structure suitable for AI processing.
@@ -85,7 +400,9 @@ class AISalesOrderExtractor:
 		formatted["has_images"] = len(images) > 0
 		formatted["image_count"] = len(images)
 		
-		formatted["key_snippets"] = self._extract_key_snippets(formatted["pages"])
+		snippet_pages = set()
+		formatted["key_snippets"] = self._extract_key_snippets(formatted["pages"], snippet_pages)
+		formatted["snippet_pages"] = snippet_pages
 		
 		return formatted
 	
@@ -122,47 +439,76 @@ class AISalesOrderExtractor:
 		Uses the same API configuration as your existing ai_chat.py.
 		"""
 		try:
-			# Get AI API key from Frappe config (same as ai_chat.py)
-			api_key = frappe.conf.get("openrouter_api_key") or frappe.conf.get("gemini_api_key")
+			provider, api_key, extract = self._select_provider()
 			
 			if not api_key:
 				frappe.logger().warning("AI API key not found, using fallback extraction")
 				return self._fallback_extraction(formatted_content)
 			
-			# Check if using OpenRouter or direct Gemini
-			use_openrouter = frappe.conf.get("openrouter_api_key") is not None
+			# Same document and prompt extracted before (retries, re-uploads)
+			cache_key = self._extraction_cache_key(provider, prompt)
+			if cache_key:
+				cached = frappe.cache().get_value(cache_key)
+				if cached is not None:
+					frappe.logger().info("Using cached AI extraction")
+					return cached
 			
-			if use_openrouter:
-				# Use OpenRouter API (same as ai_chat.py)
-				result = self._extract_using_openrouter(api_key, prompt)
-				if result:
-					return result
-				else:
-					frappe.logger().warning("OpenRouter extraction failed, using fallback")
-					return self._fallback_extraction(formatted_content)
-			else:
-				# Use direct Gemini API
-				result = self._extract_using_gemini(api_key, prompt, formatted_content)
-				if result:
-					return result
-				else:
-					frappe.logger().warning("Gemini extraction failed, using fallback")
-					return self._fallback_extraction(formatted_content)
+			result = extract(self, api_key, prompt)
+			if result:
+				self._cache_extraction(cache_key, result)
+				return result
+			
+			frappe.logger().warning(f"{provider} extraction failed, using fallback")
+			return self._fallback_extraction(formatted_content)
 			
 		except Exception as e:
 			frappe.logger().error(f"Error using AI extraction: {str(e)}")
 			# Fallback to rule-based extraction
 			return self._fallback_extraction(formatted_content)
 	
+	def _select_provider(self):
+		"""
+		First entry of _PROVIDERS with an API key in site config (same keys as ai_chat.py).
+		Returns (provider, api_key, extract method), api_key is None when none is set.
+		"""
+		config = _ai_config()
+		for provider, conf_key, extract in _PROVIDERS:
+			api_key = config[conf_key]
+			if api_key:
+				return provider, api_key, extract
+		return None, None, None
+	
+	def _extraction_cache_key(self, provider, prompt):
+		"""
+		Redis key for an extraction, or None when caching is disabled (ai_extract_disable_cache).
+		The prompt embeds the formatted PDF content, so hashing it covers text, tables and template.
+		"""
+		config = _ai_config()
+		if config["ai_extract_disable_cache"]:
+			return None
+		model = config["ai_model"] or ""
+		digest = hashlib.sha256(
+			"\x00".join((_EXTRACTION_CACHE_VERSION, provider, model, prompt)).encode()
+		).hexdigest()
+		return f"ai_extract:{digest}"
+	
+	def _cache_extraction(self, cache_key, result):
+		"""Store a provider extraction. Fallback (rule-based) results are never cached."""
+		if not cache_key:
+			return
+		try:
+			frappe.cache().set_value(cache_key, result, expires_in_sec=_EXTRACTION_CACHE_TTL)
+		except Exception as e:
+			frappe.logger().warning(f"Could not cache AI extraction: {str(e)}")
+	
 	def _extract_using_openrouter(self, api_key, prompt):
 		"""
 		Extract using OpenRouter API (compatible with your existing setup).
+		Unparseable or invalid JSON is sent back to the model with the error, up to _JSON_RETRIES times.
 		"""
 		try:
-			import requests
-			
 			# Get model from config or use default
-			model = frappe.conf.get("ai_model") or "google/gemini-2.0-flash-exp:free"
+			model = _ai_config()["ai_model"] or _OPENROUTER_DEFAULT_MODEL
 			
 			# Prepare messages
 			messages = [
@@ -177,85 +523,74 @@ class AISalesOrderExtractor:
 			]
 			
 			# Call OpenRouter API
-			headers = {
-				"Authorization": f"Bearer {api_key}",
-				"Content-Type": "application/json",
-				"HTTP-Referer": "https://erp.local",  # Optional
-				"X-Title": "ERPNext PDF Extractor"    # Optional
-			}
+			headers = _openrouter_headers(api_key)
 			
 			data = {
 				"model": model,
 				"messages": messages,
-				"temperature": 0.1
+				"temperature": 0.1,
+				"response_format": {"type": "json_object"}
 			}
 			
-			response = requests.post(
-				"https://openrouter.ai/api/v1/chat/completions",
-				headers=headers,
-				json=data,
-				timeout=30
-			)
-			
-			if response.status_code == 200:
-				result = response.json()
-				content = result["choices"][0]["message"]["content"]
+			for attempt in range(_JSON_RETRIES + 1):
+				response = _HTTP.post(
+					"https://openrouter.ai/api/v1/chat/completions",
+					headers=headers,
+					json=data,
+					timeout=30
+				)
 				
-				# Clean up the response (remove markdown formatting if present)
-				content = content.strip()
-				if content.startswith("```json"):
-					content = content[7:]
-				if content.startswith("```"):
-					content = content[3:]
-				if content.endswith("```"):
-					content = content[:-3]
-				content = content.strip()
+				if response.status_code != 200:
+					frappe.logger().error(f"OpenRouter API error: {response.status_code} - {response.text}")
+					return None
 				
-				# Parse JSON
-				extracted_data = json.loads(content)
+				content = response.json()["choices"][0]["message"]["content"]
+				try:
+					extracted_data = _parse_extraction(content)
+				except ValueError as e:
+					if attempt == _JSON_RETRIES:
+						raise
+					frappe.logger().warning(f"OpenRouter returned invalid JSON, retrying with feedback: {str(e)}")
+					messages.append({"role": "assistant", "content": content})
+					messages.append({"role": "user", "content": _JSON_RETRY_FEEDBACK.format(error=e)})
+					time.sleep(_JSON_RETRY_BACKOFF * 2 ** attempt)
+					continue
 				
 				frappe.logger().info(f"Successfully extracted data using OpenRouter ({model})")
 				return extracted_data
-			else:
-				frappe.logger().error(f"OpenRouter API error: {response.status_code} - {response.text}")
-				return None
 			
 		except Exception as e:
 			frappe.logger().error(f"Error using OpenRouter extraction: {str(e)}")
 			return None
 	
-	def _extract_using_gemini(self, api_key, prompt, formatted_content):
+	def _extract_using_gemini(self, api_key, prompt):
 		"""
 		Extract using direct Gemini API.
+		Unparseable or invalid JSON is sent back to the model with the error, up to _JSON_RETRIES times.
 		"""
 		try:
-			import google.generativeai as genai
-			
-			# Configure Gemini
-			genai.configure(api_key=api_key)
-			
 			# Get model
-			model_name = frappe.conf.get("ai_model") or "gemini-1.5-flash"
-			model = genai.GenerativeModel(model_name)
-			
-			# Generate response
-			response = model.generate_content(prompt)
-			content = response.text.strip()
-			
-			# Clean up the response (remove markdown formatting if present)
-			if content.startswith("```json"):
-				content = content[7:]
-			if content.startswith("```"):
-				content = content[3:]
-			if content.endswith("```"):
-				content = content[:-3]
-			content = content.strip()
-			
-			# Parse JSON
-			extracted_data = json.loads(content)
-			
-			frappe.logger().info(f"Successfully extracted data using Gemini ({model_name})")
-			return extracted_data
+			model_name = _ai_config()["ai_model"] or _GEMINI_DEFAULT_MODEL
+			gemini = _gemini_model(api_key, model_name)
+			
+			contents = [{"role": "user", "parts": [prompt]}]
+			for attempt in range(_JSON_RETRIES + 1):
+				# Generate response
+				response = gemini.generate_content(contents)
+				content = response.text
+				try:
+					extracted_data = _parse_extraction(content)
+				except ValueError as e:
+					if attempt == _JSON_RETRIES:
+						raise
+					frappe.logger().warning(f"Gemini returned invalid JSON, retrying with feedback: {str(e)}")
+					contents.append({"role": "model", "parts": [content]})
+					contents.append({"role": "user", "parts": [_JSON_RETRY_FEEDBACK.format(error=e)]})
+					time.sleep(_JSON_RETRY_BACKOFF * 2 ** attempt)
+					continue
+				
+				frappe.logger().info(f"Successfully extracted data using Gemini ({model_name})")
+				return extracted_data
 			
 		except Exception as e:
 			frappe.logger().error(f"Error using Gemini extraction: {str(e)}")
@@ -283,20 +618,19 @@ class AISalesOrderExtractor:
 		}
 		
 		# Extract customer information
-		customer_match = re.search(r'(?:Customer|Client|Bill To|Sold To)[:\s]+([^\n]+)', text, re.IGNORECASE)
+		customer_match = _CUSTOMER_RE.search(text)
 		if customer_match:
 			extracted_data["customer_name"] = customer_match.group(1).strip()
 		
 		# Extract dates
-		date_pattern = r'\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b'
-		dates = re.findall(date_pattern, text)
+		dates = _DATE_ANY_RE.findall(text)
 		if dates:
 			extracted_data["transaction_date"] = dates[0]
 			if len(dates) > 1:
 				extracted_data["delivery_date"] = dates[1]
 		
 		# Extract PO number
-		po_match = re.search(r'(?:PO|Purchase Order)[#:\s]+([A-Z0-9\-]+)', text, re.IGNORECASE)
+		po_match = _PO_RE.search(text)
 		if po_match:
 			extracted_data["po_no"] = po_match.group(1).strip()
 		
@@ -323,9 +657,14 @@ class AISalesOrderExtractor:
 				continue
 			
 			# Find column indices
-			item_col = self._find_column_index(headers, ["item", "product", "description", "part"])
-			qty_col = self._find_column_index(headers, ["qty", "quantity", "qnty"])
-			rate_col = self._find_column_index(headers, ["rate", "price", "unit price", "amount"])
+			headers_lower = [str(header).lower().strip() if header else "" for header in headers]
+			item_col = self._find_column_index(headers_lower, _ITEM_KEYS)
+			qty_col = self._find_column_index(headers_lower, _QTY_KEYS)
+			rate_col = self._find_column_index(headers_lower, _RATE_KEYS)
+			
+			if pd is not None and len(rows) >= _VECTORIZE_MIN_ROWS:
+				items.extend(self._extract_items_from_frame(rows, item_col, qty_col, rate_col))
+				continue
 			
 			# Extract items
 			for row in rows:
@@ -345,26 +684,20 @@ class AISalesOrderExtractor:
 				if qty_col is not None and qty_col < len(row):
 					qty_text = row[qty_col]
 					if qty_text:
-						try:
-							# Extract number from string
-							qty_match = re.search(r'(\d+(?:\.\d+)?)', str(qty_text))
-							if qty_match:
-								item_data["qty"] = float(qty_match.group(1))
-						except:
-							pass
+						# Extract number from string, the match is always a valid float literal
+						qty_match = _QTY_RE.search(str(qty_text))
+						if qty_match:
+							item_data["qty"] = float(qty_match.group(1))
 				
 				# Extract rate
 				if rate_col is not None and rate_col < len(row):
 					rate_text = row[rate_col]
 					if rate_text:
-						try:
-							# Extract number from string (remove currency symbols)
-							rate_match = re.search(r'(\d+(?:,\d{3})*(?:\.\d+)?)', str(rate_text))
-							if rate_match:
-								rate_str = rate_match.group(1).replace(',', '')
-								item_data["rate"] = float(rate_str)
-						except:
-							pass
+						# Extract number from string (remove currency symbols),
+						# valid float literal once the thousands separators are dropped
+						rate_match = _RATE_RE.search(str(rate_text))
+						if rate_match:
+							item_data["rate"] = float(rate_match.group(1).replace(',', ''))
 				
 				# Only add item if it has required fields
 				if item_data.get("item_code") and item_data.get("qty"):
@@ -372,6 +705,38 @@ class AISalesOrderExtractor:
 		
 		return items
 	
+	def _extract_items_from_frame(self, rows, item_col, qty_col, rate_col):
+		"""
+		Column-wise version of the row loop in _extract_items_from_tables, same rules:
+		an item needs a non-blank item cell and a non-zero quantity, the rate is optional.
+		"""
+		df = pd.DataFrame([row for row in rows if row])
+		if item_col is None or qty_col is None or item_col >= df.shape[1] or qty_col >= df.shape[1]:
+			return []
+		
+		def text_column(col):
+			series = df[col]
+			return series.where(series.notna(), "").astype(str)
+		
+		item_series = text_column(item_col).str.strip()
+		qty_series = pd.to_numeric(text_column(qty_col).str.extract(_QTY_RE, expand=False), errors="coerce")
+		if rate_col is not None and rate_col < df.shape[1]:
+			rate_series = pd.to_numeric(
+				text_column(rate_col).str.extract(_RATE_RE, expand=False).str.replace(",", "", regex=False),
+				errors="coerce"
+			)
+		else:
+			rate_series = pd.Series(float("nan"), index=df.index)
+		
+		mask = (item_series != "") & qty_series.notna() & (qty_series != 0)
+		items = []
+		for item_code, qty, rate in zip(item_series[mask], qty_series[mask], rate_series[mask]):
+			item_data = {"item_code": item_code, "item_name": item_code, "qty": float(qty)}
+			if not pd.isna(rate):
+				item_data["rate"] = float(rate)
+			items.append(item_data)
+		return items
+	
 	def _extract_items_from_text(self, text):
 		"""Extract item information from plain text (fallback)."""
 		items = []
@@ -379,108 +744,69 @@ class AISalesOrderExtractor:
 		# This is a basic implementation - can be enhanced based on your PDF formats
 		# Look for patterns like: "Item: XYZ, Qty: 10, Rate: 100"
 		
-		item_pattern = r'(?:Item|Product)[:\s]+([^\n,]+)(?:.*?)(?:Qty|Quantity)[:\s]+(\d+(?:\.\d+)?)(?:.*?)(?:Rate|Price)[:\s]+(\d+(?:\.\d+)?)'
-		matches = re.findall(item_pattern, text, re.IGNORECASE)
+		# Most PDFs have neither keyword, skip the regex scan entirely for them
+		lower_text = text.lower()
+		if "item" not in lower_text and "product" not in lower_text:
+			return items
 		
-		for match in matches:
+		for match in _ITEM_LINE_RE.finditer(text):
+			item_code = match.group(1).strip()
 			items.append({
-				"item_code": match[0].strip(),
-				"item_name": match[0].strip(),
-				"qty": float(match[1]),
-				"rate": float(match[2])
+				"item_code": item_code,
+				"item_name": item_code,
+				"qty": float(match.group(2)),
+				"rate": float(match.group(3))
 			})
 		
 		return items
 	
-	def _find_column_index(self, headers, possible_names):
-		"""Find column index by matching possible header names."""
-		for idx, header in enumerate(headers):
-			if not header:
-				continue
-			header_lower = str(header).lower().strip()
-			for name in possible_names:
-				if name.lower() in header_lower:
-					return idx
+	def _find_column_index(self, headers_lower, keys):
+		"""Find column index by matching lowercase keywords against the lowercased headers."""
+		for idx, header in enumerate(headers_lower):
+			if any(key in header for key in keys):
+				return idx
 		return None
 	
 	def _build_extraction_prompt(self, formatted_content):
 		"""Build the AI extraction prompt."""
-		text = formatted_content.get("text", "")
+		text = self._prompt_text(formatted_content)
 		tables = formatted_content.get("tables", [])
 		
-		prompt = f"""
-Extract sales order information from the following PDF content and return it as a JSON object.
-
-**PDF Content:**
-
-{text[:3000]}  # Limit to first 3000 chars to avoid token limits
-
-"""
+		parts = [_PROMPT_HEADER, text, "\n\n"]
 		
 		if tables:
-			prompt += f"\n**Tables Found:** {len(tables)} table(s)\n"
-			if formatted_content.get("table_previews"):
-				for table_preview in formatted_content["table_previews"][:3]:
-					prompt += f"\nTable (Page {table_preview.get('page')}):\n"
-					prompt += f"Headers: {table_preview.get('headers')}\n"
-					prompt += f"Sample Rows: {table_preview.get('rows')}\n"
-
-		if formatted_content.get("key_snippets"):
-			prompt += "\n**Key Information Snippets:**\n"
-			for snippet in formatted_content["key_snippets"][:20]:
-				prompt += f"- {snippet}\n"
+			parts.append(f"\n**Tables Found:** {len(tables)} table(s)\n")
+			for table_preview in (formatted_content.get("table_previews") or [])[:3]:
+				parts.append(
+					f"\nTable (Page {table_preview.get('page')}):\n"
+					f"Headers: {table_preview.get('headers')}\n"
+					f"Sample Rows: {table_preview.get('rows')}\n"
+				)
 		
-		prompt += """
-
-**Required JSON Format:**
-{
-  "customer": "customer_id_or_name",
-  "customer_name": "customer display name",
-  "transaction_date": "YYYY-MM-DD",
-  "delivery_date": "YYYY-MM-DD",
-  "po_no": "purchase order number",
-  "po_date": "YYYY-MM-DD",
-  "company": "company name",
-  "items": [
-    {
-      "item_code": "item code or name",
-      "item_name": "item description",
-      "qty": 10,
-      "rate": 100.00,
-      "uom": "unit of measure"
-    }
-  ]
-}
-
-**Instructions:**
-1. Extract customer information (name, ID if available)
-2. Extract all dates in YYYY-MM-DD format
-3. Extract each line item with: item code/name, quantity, rate/price
-4. If UOM (unit of measure) is mentioned, include it
-5. Extract PO number and date if available
-6. Return ONLY valid JSON, no markdown formatting
-7. If a field is not found, use null
-
-Please extract and return the JSON:
-"""
+		if formatted_content.get("key_snippets"):
+			parts.append("\n**Key Information Snippets:**\n")
+			parts.extend(f"- {snippet}\n" for snippet in formatted_content["key_snippets"][:20])
 		
-		return prompt
+		parts.append(_PROMPT_SCHEMA)
+		return "".join(parts)
 	
-	def _get_extraction_prompt(self):
-		"""Get the extraction prompt template."""
-		return """
-You are a sales order data extraction specialist. Your task is to extract structured sales order information from PDF content.
-
-Extract the following information:
-- Customer name/ID
-- Order date (transaction date)
-- Delivery date
-- Purchase order number and date (if available)
-- Company name
-- Line items with: item code, description, quantity, rate, UOM
-
-Return the data as a well-structured JSON object.
-"""
+	def _prompt_text(self, formatted_content):
+		"""
+		PDF text for the prompt, cut to the ai_max_input_tokens budget.
+		When the text does not fit, pages with key snippets (customer, PO, dates, totals) go first
+		so the cut drops the least useful pages instead of whatever comes last.
+		"""
+		max_tokens = int(_ai_config()["ai_max_input_tokens"] or _DEFAULT_MAX_INPUT_TOKENS)
+		text, truncated = _truncate_to_tokens(formatted_content.get("text", ""), max_tokens)
+		
+		snippet_pages = formatted_content.get("snippet_pages")
+		pages = formatted_content.get("pages") or []
+		if not truncated or not snippet_pages or not pages:
+			return text
+		
+		ordered = [page for page in pages if page.get("page_number") in snippet_pages]
+		ordered += [page for page in pages if page.get("page_number") not in snippet_pages]
+		return _truncate_to_tokens("\n".join(page.get("text") or "" for page in ordered), max_tokens)[0]
 	
 	def _structure_sales_order_data(self, extracted_data):
 		"""
@@ -518,38 +844,40 @@ Return the data as a well-structured JSON object.
 		if not structured_data:
 			return structured_data
 		
+		# Nothing the rule-based extraction could fill, skip its regex pass over the whole text
+		items = structured_data.get("items")
+		needs_fallback = (
+			any(_is_missing(structured_data.get(field)) for field in _MERGE_HEADER_FIELDS)
+			or _is_missing(items)
+			or any(_is_missing(item.get(field)) for item in items for field in _FALLBACK_ITEM_FIELDS)
+		)
+		if not needs_fallback:
+			return structured_data
+		
 		fallback_raw = self._fallback_extraction(formatted_content)
 		if not fallback_raw:
 			return structured_data
 		
 		fallback_structured = self._structure_sales_order_data(fallback_raw)
-		merged_data = copy.deepcopy(structured_data)
-		
-		def is_missing(value):
-			if value is None:
-				return True
-			if isinstance(value, str) and not value.strip():
-				return True
-			if isinstance(value, list) and len(value) == 0:
-				return True
-			return False
-		
-		for field in ["customer", "transaction_date", "delivery_date", "po_no", "po_date", "company"]:
-			if is_missing(merged_data.get(field)) and fallback_structured.get(field):
+		# Top-level copy is enough: the items list is replaced below, never mutated, and items are copied
+		merged_data = dict(structured_data)
+		
+		for field in _MERGE_HEADER_FIELDS:
+			if _is_missing(merged_data.get(field)) and fallback_structured.get(field):
 				merged_data[field] = fallback_structured.get(field)
 		
 		fallback_items = fallback_structured.get("items", [])
 		current_items = merged_data.get("items", [])
 		
-		if is_missing(current_items) and fallback_items:
+		if _is_missing(current_items) and fallback_items:
 			merged_data["items"] = fallback_items
 		elif current_items and fallback_items:
 			merged_items = []
 			for idx, item in enumerate(current_items):
 				fallback_item = fallback_items[idx] if idx < len(fallback_items) else {}
 				merged_item = item.copy()
-				for field in ["item_code", "item_name", "qty", "rate", "uom"]:
-					if is_missing(merged_item.get(field)) and fallback_item.get(field):
+				for field in _MERGE_ITEM_FIELDS:
+					if _is_missing(merged_item.get(field)) and fallback_item.get(field):
 						merged_item[field] = fallback_item.get(field)
 				merged_items.append(merged_item)
 			
@@ -580,37 +908,37 @@ Return the data as a well-structured JSON object.
 		if not header:
 			return ""
 		header_text = str(header).strip()
-		header_text = re.sub(r'\s+', ' ', header_text)
+		header_text = _HEADER_WS_RE.sub(' ', header_text)
 		return header_text
 
-	def _extract_key_snippets(self, pages):
-		"""Extract important snippets (customer, PO, dates, totals) to guide the AI."""
+	def _extract_key_snippets(self, pages, snippet_pages=None):
+		"""
+		Extract important snippets (customer, PO, dates, totals) to guide the AI.
+		Page numbers that yielded a snippet are added to snippet_pages when given.
+		"""
 		if not pages:
 			return []
 		
-		keywords = {
-			"Customer": ["customer", "client", "bill to", "sold to", "ship to"],
-			"PO": ["purchase order", "po#", "po no", "order no", "quote no"],
-			"Dates": ["date", "delivery", "ship date", "due date"],
-			"Totals": ["total", "subtotal", "amount", "balance"]
-		}
-		
 		snippets = []
 		for page in pages:
 			page_text = page.get("text") or ""
 			if not page_text:
 				continue
 			
-			lines = [line.strip() for line in page_text.splitlines() if line.strip()]
-			for line in lines:
+			page_number = page.get("page_number")
+			for raw_line in page_text.splitlines():
+				line = raw_line.strip()
+				if not line:
+					continue
 				lower_line = line.lower()
-				for label, terms in keywords.items():
-					if any(term in lower_line for term in terms):
-						snippets.append(f"[{label} | Page {page.get('page_number')}] {line}")
+				for term, label in _SNIPPET_TERMS:
+					if term in lower_line:
+						snippets.append(f"[{label} | Page {page_number}] {line}")
+						if snippet_pages is not None:
+							snippet_pages.add(page_number)
+						if len(snippets) >= 40:
+							return snippets
 						break
-			
-			if len(snippets) >= 40:
-				break
 		
 		return snippets
 	
@@ -621,33 +949,35 @@ Return the data as a well-structured JSON object.
 		if not date_str:
 			return None
 		
-		try:
-			from dateutil import parser
-			parsed_date = parser.parse(str(date_str))
-			return parsed_date.strftime("%Y-%m-%d")
-		except:
-			# Try common formats manually
-			import re
-			
-			# Try DD-MM-YYYY or DD/MM/YYYY
-			match = re.match(r'(\d{1,2})[-/](\d{1,2})[-/](\d{4})', date_str)
-			if match:
-				day, month, year = match.groups()
-				return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-			
-			# Try MM-DD-YYYY or MM/DD/YYYY
-			match = re.match(r'(\d{1,2})[-/](\d{1,2})[-/](\d{4})', date_str)
-			if match:
-				month, day, year = match.groups()
-				return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-			
-			# Try YYYY-MM-DD (already normalized)
-			match = re.match(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})', date_str)
-			if match:
-				year, month, day = match.groups()
-				return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-			
+		date_str = str(date_str)
+		
+		# Fast path for plain numeric dates, read the way dateutil reads them:
+		# month first unless the first number can't be a month
+		match = _DATE_NUMERIC_RE.match(date_str)
+		if match:
+			if match.group(1):
+				year, month, day = match.group(1, 2, 3)
+			else:
+				month, day, year = match.group(4, 5, 6)
+				if int(month) > 12:
+					month, day = day, month
+			try:
+				return date(int(year), int(month), int(day)).isoformat()
+			except ValueError:
+				pass
+		
+		if not date_parser:
 			return None
 		
-		return None
+		try:
+			return date_parser.parse(date_str).strftime("%Y-%m-%d")
+		except (ValueError, OverflowError):
+			return None
+
 
+# Providers in order of preference, the first with an API key in site config is used.
+# Every extract method takes (self, api_key, prompt).
+_PROVIDERS = (
+	("openrouter", "openrouter_api_key", AISalesOrderExtractor._extract_using_openrouter),
+	("gemini", "gemini_api_key", AISalesOrderExtractor._extract_using_gemini),
+)
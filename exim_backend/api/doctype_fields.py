@@ -3,7 +3,67 @@ DocType Fields API - Dynamic field retrieval with child tables
 Provides comprehensive field metadata for intelligent AI prompting
 """
 
+import functools
+import time
+
 import frappe
+from frappe.utils.response import json_handler
+from werkzeug.wrappers import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Built field payloads are cached in Redis under this prefix. Keys carry the DocType's
+# modified timestamp, and clear_fields_cache drops them all on schema changes.
+_FIELDS_CACHE_PREFIX = "dtf:"
+# Bump when the payload shape changes, entries of the old shape are then never read
+_FIELDS_CACHE_VERSION = "v2"
+_FIELDS_CACHE_TTL = 3600
+
+# Dotted paths of the field endpoints, _respond only encodes for requests made to them
+_GET_DOCTYPE_FIELDS_CMD = f"{__name__}.get_doctype_fields"
+_GET_MULTIPLE_DOCTYPES_FIELDS_CMD = f"{__name__}.get_multiple_doctypes_fields"
+
+# Layout-only field types, they carry no data and are left out of field payloads
+LAYOUT_FIELDTYPES = frozenset({"Section Break", "Column Break", "Tab Break", "HTML", "Button"})
+
+# DocField attributes _field_dict only includes when set
+_FIELD_OPTIONAL_ATTRS = ("options", "default", "description")
+
+# Modules whose DocTypes get_all_doctypes lists besides custom ones, system DocTypes are left out
+_IMPORTANT_MODULES = frozenset({
+    'Accounts', 'Stock', 'Selling', 'Buying', 'CRM',
+    'HR', 'Support', 'Projects', 'Manufacturing',
+    'Assets', 'Loan Management', 'Healthcare',
+    'Education', 'Non Profit', 'Agriculture',
+    'Exim Backend'  # Your custom module
+})
+
+# Common aliases used by detect_doctypes_from_query, on top of each DocType's own name
+_DOCTYPE_ALIASES = {
+    "Customer": ("client", "clients", "buyer", "buyers"),
+    "Item": ("product", "products", "goods", "sku"),
+    "Sales Order": ("so", "order", "orders"),
+    "Sales Invoice": ("invoice", "invoices", "bill", "bills", "sales invoice"),
+    "Purchase Order": ("po", "procurement", "purchase order"),
+    "Supplier": ("vendor", "vendors"),
+    "Quotation": ("quote", "quotes"),
+    "Delivery Note": ("delivery", "deliveries", "shipment"),
+    "Payment Entry": ("payment entry", "payment entries", "payments", "payment"),
+    "Journal Entry": ("journal entry", "journal entries", "journal"),
+    "Purchase Invoice": ("purchase invoice", "purchase invoices", "vendor invoice"),
+}
+
+# detect_doctypes_from_query keyword tables, keyed by site -> (expires_at, table)
+_KEYWORD_TABLE_CACHE = {}
+_KEYWORD_TABLE_TTL = 300
+# Keywords are indexed by this many leading characters for _scan_keywords
+_SCAN_PREFIX_LEN = 3
+# Detections cached per keyword table, reset once this many queries are stored
+_DETECTION_CACHE_MAX = 1024
 
 
 @frappe.whitelist()
@@ -38,10 +98,19 @@ def get_doctype_fields(doctype: str, include_children: int = 1, child_doctype: s
     if not doctype:
         return _error(400, "BadRequest", "Missing doctype")
     
-    if not frappe.db.exists("DocType", doctype):
+    # Doubles as the existence check
+    modified = frappe.db.get_value("DocType", doctype, "modified", cache=True)
+    if not modified:
         return _error(404, "NotFound", f"DocType '{doctype}' not found")
     
     try:
+        include_children = int(include_children)
+        cache_key = _fields_cache_key(doctype, include_children, child_doctype, modified)
+        result = frappe.cache().get_value(cache_key)
+        if result is not None:
+            frappe.local.response.http_status_code = 200
+            return _respond({"success": True, "data": result}, _GET_DOCTYPE_FIELDS_CMD)
+        
         meta = frappe.get_meta(doctype)
         
         # If a specific child_doctype is requested, return only that child's fields
@@ -61,8 +130,8 @@ def get_doctype_fields(doctype: str, include_children: int = 1, child_doctype: s
                 "label": child_doctype,
                 "fieldname": None,
                 "child_doctype": child_doctype,
-                "fields": [_field_dict(cf) for cf in child_meta.fields],
-                "children": _collect_children(child_meta) if int(include_children) else [],
+                "fields": _field_dicts(child_meta.fields),
+                "children": _collect_children(child_meta, frozenset((doctype, child_doctype))) if include_children else [],
             }
             result = {
                 "doctype": doctype,
@@ -71,14 +140,15 @@ def get_doctype_fields(doctype: str, include_children: int = 1, child_doctype: s
             }
         else:
             # Full payload (parent + optionally all children)
-            fields = [_field_dict(f) for f in meta.fields]
+            fields = _field_dicts(meta.fields)
             result = {"doctype": doctype, "fields": fields, "children": []}
             
-            if int(include_children):
-                result["children"] = _collect_children(meta)
+            if include_children:
+                result["children"] = _collect_children(meta, frozenset((doctype,)))
         
+        frappe.cache().set_value(cache_key, result, expires_in_sec=_FIELDS_CACHE_TTL)
         frappe.local.response.http_status_code = 200
-        return {"success": True, "data": result}
+        return _respond({"success": True, "data": result}, _GET_DOCTYPE_FIELDS_CMD)
     
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get DocType Fields Error")
@@ -114,32 +184,51 @@ def get_multiple_doctypes_fields(doctypes: str | list, include_children: int = 1
         return _error(400, "BadRequest", "No doctypes provided")
     
     try:
+        include_children = int(include_children)
+        cache = frappe.cache()
         result = {}
         errors = []
         
+        # One query validates every name and fetches the modified stamps for the cache keys
+        modified_by_doctype = dict(frappe.get_all(
+            "DocType",
+            filters={"name": ("in", doctype_list)},
+            fields=["name", "modified"],
+            as_list=True,
+        ))
+        
+        # Cached payloads are read through the cache wrapper, meta is only loaded for the misses
+        cache_keys = {
+            doctype: _fields_cache_key(doctype, include_children, None, modified)
+            for doctype, modified in modified_by_doctype.items()
+        }
+        
         for doctype in doctype_list:
-            if not frappe.db.exists("DocType", doctype):
+            if doctype not in cache_keys:
                 errors.append(f"DocType '{doctype}' not found")
                 continue
             
             try:
-                meta = frappe.get_meta(doctype)
-                fields = [_field_dict(f) for f in meta.fields]
-                
-                result[doctype] = {
-                    "doctype": doctype,
-                    "fields": fields,
-                    "children": _collect_children(meta) if int(include_children) else [],
-                }
+                cache_key = cache_keys[doctype]
+                payload = cache.get_value(cache_key)
+                if payload is None:
+                    meta = frappe.get_meta(doctype)
+                    payload = {
+                        "doctype": doctype,
+                        "fields": _field_dicts(meta.fields),
+                        "children": _collect_children(meta, frozenset((doctype,))) if include_children else [],
+                    }
+                    cache.set_value(cache_key, payload, expires_in_sec=_FIELDS_CACHE_TTL)
+                result[doctype] = payload
             except Exception as e:
                 errors.append(f"Error fetching '{doctype}': {str(e)}")
         
         frappe.local.response.http_status_code = 200
-        return {
+        return _respond({
             "success": True,
             "data": result,
             "errors": errors if errors else None,
-        }
+        }, _GET_MULTIPLE_DOCTYPES_FIELDS_CMD)
     
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get Multiple DocTypes Fields Error")
@@ -188,36 +277,22 @@ def get_all_doctypes(filters: str | None = None):
             # Get all DocTypes but exclude hidden/internal ones
             filter_dict['istable'] = 0  # Exclude child tables
         
-        # Get DocTypes
-        doctypes = frappe.get_all(
+        # Get DocTypes, keeping only custom DocTypes and DocTypes from important modules
+        filtered_doctypes = frappe.get_all(
             'DocType',
             fields=['name', 'module', 'custom', 'issingle', 'istable'],
             filters=filter_dict,
+            or_filters={'custom': 1, 'module': ('in', sorted(_IMPORTANT_MODULES))},
             order_by='name'
         )
         
-        # Filter out system DocTypes
-        important_modules = [
-            'Accounts', 'Stock', 'Selling', 'Buying', 'CRM', 
-            'HR', 'Support', 'Projects', 'Manufacturing',
-            'Assets', 'Loan Management', 'Healthcare',
-            'Education', 'Non Profit', 'Agriculture',
-            'Exim Backend'  # Your custom module
-        ]
-        
-        # Keep custom DocTypes and DocTypes from important modules
-        filtered_doctypes = [
-            dt for dt in doctypes 
-            if dt.get('custom') == 1 or dt.get('module') in important_modules
-        ]
-        
         frappe.local.response.http_status_code = 200
         return {
             "success": True,
             "data": {
                 "doctypes": filtered_doctypes,
                 "count": len(filtered_doctypes),
-                "total_system_doctypes": len(doctypes)
+                "total_system_doctypes": frappe.db.count('DocType', filter_dict)
             }
         }
     
@@ -255,166 +330,248 @@ def detect_doctypes_from_query(query: str):
         return _error(400, "BadRequest", "Missing query")
     
     try:
-        query_lower = query.lower()
-        
-        # Get all available DocTypes from the system
-        all_doctypes_response = get_all_doctypes()
-        
-        if not all_doctypes_response.get("success"):
-            # Fallback to hardcoded list if API fails
-            available_doctypes = ["Customer", "Item", "Sales Order", "Sales Invoice"]
-        else:
-            available_doctypes = [dt['name'] for dt in all_doctypes_response['data']['doctypes']]
+        table = _keyword_table()
         
-        # Build dynamic keyword mapping based on actual DocTypes
-        doctype_keywords = {}
-        
-        # Common patterns for DocType names
-        for doctype in available_doctypes:
-            doctype_lower = doctype.lower()
-            keywords = [doctype_lower]
-            
-            # Add plural form
-            if not doctype_lower.endswith('s'):
-                keywords.append(doctype_lower + 's')
-            
-            # Add variations - but be more specific
-            if ' ' in doctype:
-                # "Sales Order" → ["sales order", "salesorder"]
-                # Don't add individual words to avoid false matches
-                keywords.append(doctype_lower.replace(' ', ''))
-            
-            # Add common aliases
-            aliases = {
-                "Customer": ["client", "clients", "buyer", "buyers"],
-                "Item": ["product", "products", "goods", "sku"],
-                "Sales Order": ["so", "order", "orders"],
-                "Sales Invoice": ["invoice", "invoices", "bill", "bills", "sales invoice"],
-                "Purchase Order": ["po", "procurement", "purchase order"],
-                "Supplier": ["vendor", "vendors"],
-                "Quotation": ["quote", "quotes"],
-                "Delivery Note": ["delivery", "deliveries", "shipment"],
-                "Payment Entry": ["payment entry", "payment entries", "payments", "payment"],
-                "Journal Entry": ["journal entry", "journal entries", "journal"],
-                "Purchase Invoice": ["purchase invoice", "purchase invoices", "vendor invoice"],
-            }
-            
-            if doctype in aliases:
-                keywords.extend(aliases[doctype])
-            
-            doctype_keywords[doctype] = keywords
-        
-        detected = {}
-        keywords_matched = {}
-        
-        # Check each DocType - prioritize exact phrase matches first
-        for doctype, keywords in doctype_keywords.items():
-            matched = []
-            exact_match = False
-            exact_phrase_match = False
-            
-            # First, check for exact phrase matches (multi-word DocTypes)
-            if ' ' in doctype:
-                doctype_phrase = doctype.lower()
-                if doctype_phrase in query_lower:
-                    matched.append(doctype_phrase)
-                    exact_phrase_match = True
-                    exact_match = True
-            
-            # Then check individual keywords
-            for keyword in keywords:
-                if keyword in query_lower and keyword not in matched:
-                    matched.append(keyword)
-                    # Check if it's an exact word match (not just substring)
-                    import re
-                    if re.search(r'\b' + re.escape(keyword) + r'\b', query_lower):
-                        exact_match = True
-            
-            if matched:
-                # Calculate confidence based on keyword matches
-                # Exact phrase matches get highest confidence
-                if exact_phrase_match:
-                    base_confidence = 0.98  # Very high for exact phrase
-                elif exact_match:
-                    base_confidence = 0.9
-                else:
-                    base_confidence = 0.6
-                
-                confidence = min(0.98, base_confidence + (len(matched) * 0.02))
-                detected[doctype] = confidence
-                keywords_matched[doctype] = matched
-        
-        # Sort by confidence
-        detected_list = sorted(detected.keys(), key=lambda k: detected[k], reverse=True)
-        
-        # IMPROVEMENT 1: Minimum confidence threshold
-        min_confidence = 0.7
-        detected_list = [
-            dt for dt in detected_list 
-            if detected[dt] >= min_confidence
-        ]
-        
-        # IMPROVEMENT 2: Limit based on query complexity
-        query_words = len(query.split())
-        if query_words <= 5:  # Simple query
-            detected_list = detected_list[:1]  # Only top 1
-        elif query_words <= 10:  # Medium query
-            detected_list = detected_list[:2]  # Top 2
-        else:  # Complex query
-            detected_list = detected_list[:3]  # Top 3
-        
-        # IMPROVEMENT 3: If no high-confidence matches, try semantic fallback
-        if not detected_list:
-            # Common patterns
-            query_lower = query.lower()
-            if "who" in query_lower or "customer" in query_lower:
-                detected_list = ["Customer"]
-            elif "what" in query_lower or "item" in query_lower or "product" in query_lower:
-                detected_list = ["Item"]
-            elif "order" in query_lower:
-                detected_list = ["Sales Order"]
-            elif "invoice" in query_lower or "bill" in query_lower:
-                detected_list = ["Sales Invoice"]
-            else:
-                # Default fallback
-                detected_list = ["Customer", "Item", "Sales Order"]
-            
-            frappe.logger().info(f"[DocType Detection] Using semantic fallback: {detected_list}")
-            # Set default confidence for fallback
-            for dt in detected_list:
-                if dt not in detected:
-                    detected[dt] = 0.6
-                    keywords_matched[dt] = ["semantic_fallback"]
+        # Repeated questions are answered from the table's detection cache. The result only
+        # depends on the lowered query and the table, so it goes when the table is rebuilt.
+        detections = table["detections"]
+        detection_key = query.lower().strip()
+        data = detections.get(detection_key)
+        if data is None:
+            data = _detect_doctypes(detection_key, table)
+            if len(detections) >= _DETECTION_CACHE_MAX:
+                detections.clear()
+            detections[detection_key] = data
         
         frappe.local.response.http_status_code = 200
-        return {
-            "success": True,
-            "data": {
-                "detected_doctypes": detected_list if detected_list else ["Customer", "Item", "Sales Order"],
-                "confidence": {k: detected[k] for k in detected_list},
-                "keywords_matched": {k: keywords_matched.get(k, []) for k in detected_list},
-                "all_detected": sorted(detected.keys(), key=lambda k: detected[k], reverse=True),  # Keep full list for debugging
-            }
-        }
+        return {"success": True, "data": data}
     
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Detect DocTypes Error")
         return _error(500, "InternalServerError", f"Failed to detect doctypes: {str(e)}")
 
 
-def _collect_children(meta):
-    """Recursively collect child table fields"""
+def _detect_doctypes(query_lower, table):
+    """Scoring behind detect_doctypes_from_query, returns its "data" payload."""
+    # Every keyword occurring anywhere in the query
+    found = _scan_keywords(query_lower, table["keywords_by_start"], table["short_keywords"])
+    
+    detected = {}
+    keywords_matched = {}
+    
+    # Only DocTypes with a hit, in table order so confidence ties sort as before
+    hit_entries = sorted({idx for keyword in found for idx in table["entries_by_keyword"][keyword]})
+    for idx in hit_entries:
+        doctype, is_phrase, keywords = table["entries"][idx]
+        matched = [keyword for keyword in keywords if keyword in found]
+        
+        # Exact phrase matches (multi-word DocTypes) count as exact even inside a longer word
+        exact_phrase_match = is_phrase and keywords[0] in found
+        exact_match = exact_phrase_match or any(_word_bounded(query_lower, keyword) for keyword in matched)
+        
+        # Calculate confidence based on keyword matches
+        # Exact phrase matches get highest confidence
+        if exact_phrase_match:
+            base_confidence = 0.98  # Very high for exact phrase
+        elif exact_match:
+            base_confidence = 0.9
+        else:
+            base_confidence = 0.6
+        
+        confidence = min(0.98, base_confidence + (len(matched) * 0.02))
+        detected[doctype] = confidence
+        keywords_matched[doctype] = matched
+    
+    # Sort by confidence
+    detected_list = sorted(detected.keys(), key=lambda k: detected[k], reverse=True)
+    
+    # IMPROVEMENT 1: Minimum confidence threshold
+    min_confidence = 0.7
+    detected_list = [
+        dt for dt in detected_list 
+        if detected[dt] >= min_confidence
+    ]
+    
+    # IMPROVEMENT 2: Limit based on query complexity
+    query_words = len(query_lower.split())
+    if query_words <= 5:  # Simple query
+        detected_list = detected_list[:1]  # Only top 1
+    elif query_words <= 10:  # Medium query
+        detected_list = detected_list[:2]  # Top 2
+    else:  # Complex query
+        detected_list = detected_list[:3]  # Top 3
+    
+    # IMPROVEMENT 3: If no high-confidence matches, try semantic fallback
+    if not detected_list:
+        # Common patterns
+        if "who" in query_lower or "customer" in query_lower:
+            detected_list = ["Customer"]
+        elif "what" in query_lower or "item" in query_lower or "product" in query_lower:
+            detected_list = ["Item"]
+        elif "order" in query_lower:
+            detected_list = ["Sales Order"]
+        elif "invoice" in query_lower or "bill" in query_lower:
+            detected_list = ["Sales Invoice"]
+        else:
+            # Default fallback
+            detected_list = ["Customer", "Item", "Sales Order"]
+        
+        frappe.logger().info(f"[DocType Detection] Using semantic fallback: {detected_list}")
+        # Set default confidence for fallback
+        for dt in detected_list:
+            if dt not in detected:
+                detected[dt] = 0.6
+                keywords_matched[dt] = ["semantic_fallback"]
+    
+    return {
+        "detected_doctypes": detected_list if detected_list else ["Customer", "Item", "Sales Order"],
+        "confidence": {k: detected[k] for k in detected_list},
+        "keywords_matched": {k: keywords_matched.get(k, []) for k in detected_list},
+        "all_detected": sorted(detected.keys(), key=lambda k: detected[k], reverse=True),  # Keep full list for debugging
+    }
+
+
+def _fields_cache_key(doctype, include_children, child_doctype, modified):
+    """Redis key for a built field payload, a schema change bumps modified and so the key"""
+    return f"{_FIELDS_CACHE_PREFIX}{_FIELDS_CACHE_VERSION}:{doctype}:{include_children}:{child_doctype or ''}:{modified}"
+
+
+def clear_fields_cache(doc, method=None):
+    """
+    Drop every cached field payload. Wired to DocType, Custom Field and Property Setter doc_events.
+    Child tables are nested in their parents' payloads and customizations don't touch
+    DocType.modified, so everything goes rather than just the changed DocType's keys.
+    """
+    frappe.cache().delete_keys(_FIELDS_CACHE_PREFIX)
+    _KEYWORD_TABLE_CACHE.clear()
+
+
+def _keyword_table():
+    """
+    Keyword lookup tables for detect_doctypes_from_query, built from get_all_doctypes.
+    Cached per site for _KEYWORD_TABLE_TTL seconds, a DocType change in this process drops it earlier.
+    """
+    site = frappe.local.site
+    cached = _KEYWORD_TABLE_CACHE.get(site)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    # Get all available DocTypes from the system
+    all_doctypes_response = get_all_doctypes()
+    
+    if not all_doctypes_response.get("success"):
+        # Fallback to hardcoded list if API fails, not cached so the next query retries
+        available_doctypes = ["Customer", "Item", "Sales Order", "Sales Invoice"]
+    else:
+        available_doctypes = [dt['name'] for dt in all_doctypes_response['data']['doctypes']]
+    
+    # (doctype, is multi-word, keywords) with the lowercased name always first
+    entries = []
+    entries_by_keyword = {}
+    for doctype in available_doctypes:
+        keywords = _derive_keywords(doctype)
+        for keyword in keywords:
+            entries_by_keyword.setdefault(keyword, []).append(len(entries))
+        entries.append((doctype, ' ' in doctype, keywords))
+    
+    keywords_by_start = {}
+    short_keywords = []
+    for keyword in entries_by_keyword:
+        if len(keyword) >= _SCAN_PREFIX_LEN:
+            keywords_by_start.setdefault(keyword[:_SCAN_PREFIX_LEN], []).append(keyword)
+        else:
+            short_keywords.append(keyword)
+    
+    table = {
+        "entries": entries,
+        "entries_by_keyword": entries_by_keyword,
+        # query_lower.strip() -> detection payload, filled by detect_doctypes_from_query
+        "detections": {},
+        "keywords_by_start": {start: tuple(keywords) for start, keywords in keywords_by_start.items()},
+        "short_keywords": tuple(short_keywords),
+    }
+    
+    if all_doctypes_response.get("success"):
+        _KEYWORD_TABLE_CACHE[site] = (now + _KEYWORD_TABLE_TTL, table)
+    return table
+
+
+@functools.lru_cache(maxsize=1024)
+def _derive_keywords(doctype):
+    """Keywords detecting doctype in a query, its lowercased name first. Depends on the name only."""
+    doctype_lower = doctype.lower()
+    keywords = [doctype_lower]
+    
+    # Add plural form
+    if not doctype_lower.endswith('s'):
+        keywords.append(doctype_lower + 's')
+    
+    # Add variations - but be more specific
+    if ' ' in doctype:
+        # "Sales Order" → ["sales order", "salesorder"]
+        # Don't add individual words to avoid false matches
+        keywords.append(doctype_lower.replace(' ', ''))
+    
+    # Add common aliases
+    keywords.extend(_DOCTYPE_ALIASES.get(doctype, ()))
+    
+    return tuple(dict.fromkeys(keywords))
+
+
+def _scan_keywords(text, keywords_by_start, short_keywords):
+    """
+    Set of keywords occurring anywhere in text (substring semantics, like `keyword in text`).
+    keywords_by_start maps the first _SCAN_PREFIX_LEN characters to the keywords starting with
+    them, so each position of text costs one dict lookup; shorter keywords are tested directly.
+    """
+    found = {keyword for keyword in short_keywords if keyword in text}
+    get_candidates = keywords_by_start.get
+    for pos in range(len(text) - _SCAN_PREFIX_LEN + 1):
+        candidates = get_candidates(text[pos:pos + _SCAN_PREFIX_LEN])
+        if candidates:
+            for keyword in candidates:
+                if text.startswith(keyword, pos):
+                    found.add(keyword)
+    return found
+
+
+def _word_bounded(hay, needle):
+    """Same as re.search(r'\b' + re.escape(needle) + r'\b', hay), without building a regex."""
+    end_offset = len(needle)
+    start = hay.find(needle)
+    while start != -1:
+        if _is_word_boundary(hay, start) and _is_word_boundary(hay, start + end_offset):
+            return True
+        start = hay.find(needle, start + 1)
+    return False
+
+
+def _is_word_boundary(text, pos):
+    """re's \b: a word character on exactly one side of pos."""
+    before = pos > 0 and (text[pos - 1].isalnum() or text[pos - 1] == "_")
+    after = pos < len(text) and (text[pos].isalnum() or text[pos] == "_")
+    return before != after
+
+
+def _collect_children(meta, visited=frozenset()):
+    """
+    Recursively collect child table fields.
+    visited holds the DocTypes on the current path, a table pointing back to one of them is skipped.
+    """
     children = []
     for f in meta.fields:
         if f.fieldtype == "Table" and f.options:
+            if f.options in visited:
+                continue
             try:
-                child_meta = frappe.get_meta(f.options)
+                fields, grandchildren = _child_table_fields(f.options, visited | {f.options})
                 child_entry = {
                     "label": f.label or f.fieldname,
                     "fieldname": f.fieldname,
                     "child_doctype": f.options,
-                    "fields": [_field_dict(cf) for cf in child_meta.fields],
-                    "children": _collect_children(child_meta),
+                    "fields": fields,
+                    "children": grandchildren,
                 }
                 children.append(child_entry)
             except Exception as e:
@@ -423,8 +580,33 @@ def _collect_children(meta):
     return children
 
 
+def _child_table_fields(child_doctype, visited=frozenset()):
+    """
+    Return (fields, children) of a child table DocType, memoized on frappe.local for the request.
+    Child tables shared by several parents (taxes, addresses, ...) are only walked once.
+    Only a cyclic schema makes the result depend on visited, the memo keeps the first path's.
+    """
+    memo = getattr(frappe.local, "doctype_fields_children", None)
+    if memo is None:
+        memo = frappe.local.doctype_fields_children = {}
+    
+    if child_doctype not in memo:
+        child_meta = frappe.get_meta(child_doctype)
+        memo[child_doctype] = (
+            _field_dicts(child_meta.fields),
+            _collect_children(child_meta, visited),
+        )
+    return memo[child_doctype]
+
+
+def _field_dicts(fields):
+    """_field_dict of every data field, layout fields (LAYOUT_FIELDTYPES) are skipped"""
+    return [_field_dict(f) for f in fields if f.fieldtype not in LAYOUT_FIELDTYPES]
+
+
 def _field_dict(f):
     """Convert field meta to dictionary with relevant info"""
+    # Only the documented DocField attributes are read, never the instance's internal state
     data = {
         "label": f.label or f.fieldname or "",
         "fieldname": f.fieldname,
@@ -433,21 +615,35 @@ def _field_dict(f):
         "read_only": getattr(f, "read_only", 0),
     }
     
-    # Add options for Link, Select, Table fields
-    if getattr(f, "options", None):
-        data["options"] = f.options
-    
-    # Add default value if exists
-    if getattr(f, "default", None):
-        data["default"] = f.default
-    
-    # Add description if exists
-    if getattr(f, "description", None):
-        data["description"] = f.description
+    # Add options (Link, Select, Table fields), default value and description if set
+    for key in _FIELD_OPTIONAL_ATTRS:
+        value = getattr(f, key, None)
+        if value:
+            data[key] = value
     
     return data
 
 
+def _respond(payload, cmd):
+    """
+    Encode a large field payload with orjson when the endpoint is the request's own cmd.
+    Frappe passes a returned Response through untouched, so the {"message": ...} envelope is built here.
+    Internal callers (e.g. intelligent_query) get the plain dict back.
+    """
+    if not orjson or frappe.form_dict.get("cmd") != cmd:
+        return payload
+    return Response(
+        # Dates/datetimes go through json_handler like Frappe's own responses (no ISO "T" format)
+        orjson.dumps(
+            {"message": payload},
+            default=json_handler,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        ),
+        status=frappe.local.response.get("http_status_code") or 200,
+        mimetype="application/json"
+    )
+
+
 def _error(status, err_type, msg):
     """Standard error response"""
     frappe.local.response.http_status_code = status
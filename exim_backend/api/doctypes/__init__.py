@@ -3,14 +3,16 @@ DocType handlers module for AI Chat system.
 Each doctype has its own handler for specific operations.
 """
 
+from types import MappingProxyType
+
 from exim_backend.api.doctypes.base_handler import BaseDocTypeHandler
 from exim_backend.api.doctypes.customer_handler import CustomerHandler
 from exim_backend.api.doctypes.item_handler import ItemHandler
 from exim_backend.api.doctypes.sales_order_handler import SalesOrderHandler
 from exim_backend.api.doctypes.sales_person_handler import SalesPersonHandler
 
-# Registry of available doctype handlers
-DOCTYPE_HANDLERS = {
+# Registry of available doctype handlers, read-only once loaded
+DOCTYPE_HANDLERS = MappingProxyType({
 	"Customer": CustomerHandler,
 	"Item": ItemHandler,
 	"Sales Order": SalesOrderHandler,
@@ -18,7 +20,10 @@ DOCTYPE_HANDLERS = {
 	# Add more doctypes here as they are implemented
 	# "Supplier": SupplierHandler,
 	# "Lead": LeadHandler,
-}
+})
+
+# Handler instances by doctype. Registered handlers keep no per-request state, so one is shared.
+_HANDLER_INSTANCES = {}
 
 
 def get_handler(doctype):
@@ -30,10 +35,12 @@ def get_handler(doctype):
 	Returns:
 		Handler instance or None if not found
 	"""
-	handler_class = DOCTYPE_HANDLERS.get(doctype)
-	if handler_class:
-		return handler_class()
-	return None
+	handler = _HANDLER_INSTANCES.get(doctype)
+	if handler is None:
+		handler_class = DOCTYPE_HANDLERS.get(doctype)
+		if handler_class:
+			handler = _HANDLER_INSTANCES[doctype] = handler_class()
+	return handler
 
 
 def get_available_doctypes():
@@ -4,9 +4,179 @@ All doctype handlers should inherit from this class.
 """
 
 import frappe
+from exim_backend.api.doctype_fields import LAYOUT_FIELDTYPES
 from frappe.utils import getdate, today, formatdate, get_first_day_of_week
 from frappe.utils.dateutils import parse_date
 from datetime import datetime, timedelta
+from types import MappingProxyType
+import re
+import time
+
+
+# Column info per DocType, keyed by (site, doctype) -> (expires_at, (column set, default select list))
+_VALID_COLUMNS_CACHE = {}
+_VALID_COLUMNS_TTL = 300
+
+# Always part of the default search projection, list view columns are added to these
+_BASE_SEARCH_COLUMNS = ("name", "modified", "owner")
+
+
+def _column_info(doctype):
+	"""
+	(frozenset of database columns, default SELECT list) for doctype,
+	memoized per site for _VALID_COLUMNS_TTL seconds.
+	The default SELECT list is _BASE_SEARCH_COLUMNS plus the in_list_view fields.
+	"""
+	cache_key = (frappe.local.site, doctype)
+	cached = _VALID_COLUMNS_CACHE.get(cache_key)
+	now = time.monotonic()
+	if cached and cached[0] > now:
+		return cached[1]
+	meta = frappe.get_meta(doctype)
+	columns = frozenset(column for column in meta.get_valid_columns() if column != "doctype")
+	search_columns = list(_BASE_SEARCH_COLUMNS)
+	for field in meta.fields:
+		if field.in_list_view and field.fieldname in columns and field.fieldname not in search_columns:
+			search_columns.append(field.fieldname)
+	info = (columns, ", ".join(f"`{column}`" for column in search_columns))
+	_VALID_COLUMNS_CACHE[cache_key] = (now + _VALID_COLUMNS_TTL, info)
+	return info
+
+
+def _valid_columns(doctype):
+	"""Database columns of doctype. Filter field names are interpolated into SQL, only these may get there."""
+	return _column_info(doctype)[0]
+
+
+# Datetime columns: date keywords resolve to the start of the day as a datetime string
+_DATETIME_FIELDS = frozenset(("creation", "modified"))
+
+# Day keywords filtered on datetime columns as a range over that day, keyword -> offset from today
+_DAY_KEYWORD_OFFSETS = MappingProxyType({"today": 0, "yesterday": -1, "tomorrow": 1})
+
+
+def _day_start(date_value, is_datetime_field):
+	"""Start of date_value as a datetime string for datetime fields, formatted date otherwise."""
+	if is_datetime_field:
+		return frappe.db.format_datetime(datetime.combine(date_value, datetime.min.time()))
+	return formatdate(date_value)
+
+
+def _today_handler(is_datetime_field):
+	if is_datetime_field:
+		return _day_start(getdate(), True)
+	return today()
+
+
+def _yesterday_handler(is_datetime_field):
+	return _day_start(getdate() - timedelta(days=1), is_datetime_field)
+
+
+def _tomorrow_handler(is_datetime_field):
+	return _day_start(getdate() + timedelta(days=1), is_datetime_field)
+
+
+def _this_week_handler(is_datetime_field):
+	return _day_start(get_first_day_of_week(today()), is_datetime_field)
+
+
+def _last_week_handler(is_datetime_field):
+	return formatdate(get_first_day_of_week(getdate() - timedelta(days=7)))
+
+
+def _this_month_handler(is_datetime_field):
+	return formatdate(getdate().replace(day=1))
+
+
+# Date keyword -> handler(is_datetime_field) returning the normalized value
+_KEYWORD_HANDLERS = {
+	"today": _today_handler,
+	"yesterday": _yesterday_handler,
+	"tomorrow": _tomorrow_handler,
+	"this week": _this_week_handler,
+	"thisweek": _this_week_handler,
+	"last week": _last_week_handler,
+	"lastweek": _last_week_handler,
+	"this month": _this_month_handler,
+	"thismonth": _this_month_handler,
+}
+
+
+def _date_param(value):
+	"""value as an ISO date string (YYYY-MM-DD) for comparing against a Date column, None if it is not a date."""
+	try:
+		return getdate(value).isoformat()
+	except Exception:
+		return None
+
+
+# Numeric dates: YYYY-MM-DD / DD-MM-YYYY / MM-DD-YYYY with "-" or "/" as separator
+_DATE_RE = re.compile(r"^(\d{1,4})([-/])(\d{1,2})\2(\d{1,4})$")
+
+
+def _parse_numeric_date(value_str):
+	"""
+	YYYY-MM-DD string for a purely numeric date, or None when value_str is not one.
+	Fallback for dates parse_date could not read. Year-first when the first group has four digits, otherwise day-first
+	(08-11-2025 is 8 November) unless only month-first gives a valid date.
+	"""
+	match = _DATE_RE.match(value_str)
+	if not match:
+		return None
+	first, _sep, second, third = match.groups()
+	if len(first) == 4:
+		if len(third) > 2:
+			return None
+		candidates = ((int(first), int(second), int(third)),)
+	elif len(third) == 4:
+		candidates = (
+			(int(third), int(second), int(first)),
+			(int(third), int(first), int(second)),
+		)
+	else:
+		return None
+	for year, month, day in candidates:
+		try:
+			return datetime(year, month, day).strftime('%Y-%m-%d')
+		except ValueError:
+			continue
+	return None
+
+
+def _op_like(field, param_name, value):
+	return f"`{field}` LIKE %({param_name})s", {param_name: value}
+
+
+def _op_is_null(field, param_name, value):
+	return f"(`{field}` IS NULL OR `{field}` = '' OR `{field}` = 'Not Set')", {}
+
+
+def _op_is_not_null(field, param_name, value):
+	return f"(`{field}` IS NOT NULL AND `{field}` != '' AND `{field}` != 'Not Set')", {}
+
+
+def _op_gte(field, param_name, value):
+	return f"`{field}` >= %({param_name})s", {param_name: value}
+
+
+def _op_lte(field, param_name, value):
+	return f"`{field}` <= %({param_name})s", {param_name: value}
+
+
+def _op_in(field, param_name, value):
+	placeholders = ", ".join([f"%({field}_{i})s" for i in range(len(value))])
+	return f"`{field}` IN ({placeholders})", {f"{field}_{i}": v for i, v in enumerate(value)}
+
+
+# Filter operator -> builder(field, param_name, value) returning (condition, values)
+_OP_BUILDERS = MappingProxyType({
+	"$like": _op_like,
+	"$is_null": _op_is_null,
+	"$is_not_null": _op_is_not_null,
+	"$gte": _op_gte,
+	"$lte": _op_lte,
+	"$in": _op_in,
+})
 
 
 class BaseDocTypeHandler:
@@ -15,6 +185,14 @@ class BaseDocTypeHandler:
 	Provides common functionality and defines the interface.
 	"""
 	
+	# Common filter names -> actual field names
+	_FIELD_ALIAS = MappingProxyType({
+		'created': 'creation',
+		'created_date': 'creation',
+		'date': 'transaction_date',
+		'order_date': 'transaction_date',
+	})
+	
 	def __init__(self):
 		self.doctype = None  # Should be set by subclasses
 		self.label = None  # Human-readable name
@@ -23,7 +201,14 @@ class BaseDocTypeHandler:
 		"""
 		Get field information for this doctype.
 		Returns: Dict with fields, child_tables, etc.
+		Successful results are memoized for the rest of the request, treat them as read-only.
 		"""
+		memo = getattr(frappe.local, "doctype_fields_info", None)
+		if memo is None:
+			memo = frappe.local.doctype_fields_info = {}
+		if self.doctype in memo:
+			return memo[self.doctype]
+		
 		try:
 			if not frappe.db.exists("DocType", self.doctype):
 				return {
@@ -34,8 +219,13 @@ class BaseDocTypeHandler:
 			meta = frappe.get_meta(self.doctype)
 			fields_info = []
 			child_tables = {}
+			# Field lists per child DocType, built once even if several tables share it
+			child_fields_by_doctype = {}
 			
 			for field in meta.fields:
+				if field.fieldtype in LAYOUT_FIELDTYPES:
+					continue
+				
 				field_data = {
 					"fieldname": field.fieldname,
 					"label": field.label,
@@ -50,16 +240,18 @@ class BaseDocTypeHandler:
 				
 				# Handle child tables
 				if field.fieldtype == "Table" and field.options:
-					child_meta = frappe.get_meta(field.options)
-					child_fields = []
-					
-					for child_field in child_meta.fields:
-						child_fields.append({
-							"fieldname": child_field.fieldname,
-							"label": child_field.label,
-							"fieldtype": child_field.fieldtype,
-							"options": child_field.options if child_field.options else None
-						})
+					child_fields = child_fields_by_doctype.get(field.options)
+					if child_fields is None:
+						child_fields = child_fields_by_doctype[field.options] = [
+							{
+								"fieldname": child_field.fieldname,
+								"label": child_field.label,
+								"fieldtype": child_field.fieldtype,
+								"options": child_field.options if child_field.options else None
+							}
+							for child_field in frappe.get_meta(field.options).fields
+							if child_field.fieldtype not in LAYOUT_FIELDTYPES
+						]
 					
 					child_tables[field.fieldname] = {
 						"label": field.label,
@@ -69,13 +261,14 @@ class BaseDocTypeHandler:
 				
 				fields_info.append(field_data)
 			
-			return {
+			result = memo[self.doctype] = {
 				"status": "success",
 				"doctype": self.doctype,
 				"fields": fields_info,
 				"child_tables": child_tables,
 				"total_fields": len(fields_info)
 			}
+			return result
 		except Exception as e:
 			frappe.logger().error(f"Get fields info error for {self.doctype}: {str(e)}")
 			return {
@@ -86,16 +279,26 @@ class BaseDocTypeHandler:
 	def build_field_reference(self, fields_info):
 		"""
 		Build a concise field reference string for AI prompt.
+		Memoized per request alongside the fields_info it was built from.
 		"""
 		if fields_info.get("status") != "success":
 			return "Fields metadata not available"
 		
+		memo = getattr(frappe.local, "doctype_field_reference", None)
+		if memo is None:
+			memo = frappe.local.doctype_field_reference = {}
+		cached = memo.get(self.doctype)
+		if cached and cached[0] is fields_info:
+			return cached[1]
+		
 		fields = fields_info.get("fields", [])
-		return "\n".join([
+		reference = "\n".join([
 			f"- {f['fieldname']} ({f['fieldtype']}){' [required]' if f.get('reqd') else ''}"
 			for f in fields
-			if not f.get('hidden') and f['fieldtype'] not in ['Section Break', 'Column Break', 'Tab Break']
+			if not f.get('hidden') and f['fieldtype'] not in LAYOUT_FIELDTYPES
 		])
+		memo[self.doctype] = (fields_info, reference)
+		return reference
 	
 	def prepare_document_data(self, fields):
 		"""
@@ -150,67 +353,15 @@ class BaseDocTypeHandler:
 		
 		value_str = str(value).strip().lower()
 		
-		frappe.logger().info(f"Normalizing date value: '{value}' -> '{value_str}' (field: {field_name})")
+		if frappe.conf.get("developer_mode"):
+			frappe.logger().debug(f"Normalizing date value: '{value}' -> '{value_str}' (field: {field_name})")
 		
 		# Handle special date keywords
-		if value_str == 'today':
-			if field_name in ['creation', 'modified']:
-				# For datetime fields, return start of today as datetime
-				from frappe.utils import get_datetime, now_datetime
-				from datetime import time as dt_time
-				today_dt = getdate()
-				today_start = get_datetime(today_dt).replace(hour=0, minute=0, second=0, microsecond=0)
-				result = frappe.db.format_datetime(today_start)
-				frappe.logger().info(f"Normalized 'today' to datetime: {result}")
-			else:
-				# For date fields, return date string
-				result = today()
-				frappe.logger().info(f"Normalized 'today' to date: {result}")
-			return result
-		elif value_str == 'yesterday':
-			if field_name in ['creation', 'modified']:
-				from frappe.utils import get_datetime
-				from datetime import time as dt_time
-				yesterday_dt = getdate() - timedelta(days=1)
-				yesterday_start = get_datetime(yesterday_dt).replace(hour=0, minute=0, second=0, microsecond=0)
-				result = frappe.db.format_datetime(yesterday_start)
-				frappe.logger().info(f"Normalized 'yesterday' to datetime: {result}")
-			else:
-				result = formatdate(getdate() - timedelta(days=1))
-				frappe.logger().info(f"Normalized 'yesterday' to date: {result}")
-			return result
-		elif value_str == 'tomorrow':
-			if field_name in ['creation', 'modified']:
-				from frappe.utils import get_datetime
-				from datetime import time as dt_time
-				tomorrow_dt = getdate() + timedelta(days=1)
-				tomorrow_start = get_datetime(tomorrow_dt).replace(hour=0, minute=0, second=0, microsecond=0)
-				result = frappe.db.format_datetime(tomorrow_start)
-				frappe.logger().info(f"Normalized 'tomorrow' to datetime: {result}")
-			else:
-				result = formatdate(getdate() + timedelta(days=1))
-				frappe.logger().info(f"Normalized 'tomorrow' to date: {result}")
-			return result
-		elif value_str in ['this week', 'thisweek']:
-			# Start of this week - return as date string for date fields, datetime for datetime fields
-			first_day = get_first_day_of_week(today())
-			# For datetime fields, return start of day as datetime string
-			if field_name in ['creation', 'modified']:
-				from frappe.utils import get_datetime
-				from datetime import time as dt_time
-				first_day_datetime = get_datetime(first_day).replace(hour=0, minute=0, second=0, microsecond=0)
-				result = frappe.db.format_datetime(first_day_datetime)
-				frappe.logger().info(f"Normalized 'this week' to datetime: {result} (first day of week: {first_day})")
-			else:
-				# For date fields, return date string
-				result = formatdate(first_day)
-				frappe.logger().info(f"Normalized 'this week' to date: {result} (first day of week: {first_day})")
-			return result
-		elif value_str in ['last week', 'lastweek']:
-			# Start of last week
-			last_week_start = getdate() - timedelta(days=7)
-			return formatdate(get_first_day_of_week(last_week_start))
-		elif 'days ago' in value_str or 'day ago' in value_str:
+		handler = _KEYWORD_HANDLERS.get(value_str)
+		if handler:
+			return handler(field_name in _DATETIME_FIELDS)
+		
+		if 'days ago' in value_str or 'day ago' in value_str:
 			# Handle "7 days ago", "1 day ago", etc.
 			try:
 				days = int(value_str.split()[0])
@@ -238,42 +389,16 @@ class BaseDocTypeHandler:
 					return formatdate(getdate() - timedelta(days=approx_days))
 			except:
 				pass
-		elif value_str in ['this month', 'thismonth']:
-			# Start of this month
-			from datetime import datetime
-			current_date = getdate()
-			first_day = current_date.replace(day=1)
-			return formatdate(first_day)
 		
-		# Try to parse the date using Frappe's date parsing
+		# Frappe's parse_date goes first, it honours the site/user date format for ambiguous dates
 		try:
-			# Frappe's parse_date handles multiple formats
-			parsed_date = parse_date(value_str)
-			return parsed_date
-		except:
-			# If Frappe parsing fails, try manual parsing
-			try:
-				# Try common formats: DD-MM-YYYY, YYYY-MM-DD, MM/DD/YYYY, etc.
-				date_formats = [
-					'%d-%m-%Y',  # 08-11-2025
-					'%Y-%m-%d',  # 2025-11-08
-					'%d/%m/%Y',  # 08/11/2025
-					'%Y/%m/%d',  # 2025/11/08
-					'%m-%d-%Y',  # 11-08-2025
-					'%m/%d/%Y',  # 11/08/2025
-				]
-				
-				for fmt in date_formats:
-					try:
-						parsed = datetime.strptime(value_str, fmt)
-						return parsed.strftime('%Y-%m-%d')
-					except:
-						continue
-				
-				# If all parsing fails, return as-is (might be a datetime string)
-				return value_str
-			except:
-				return value_str
+			return parse_date(value_str)
+		except Exception:
+			pass
+		
+		# Numeric layouts parse_date rejected are resolved directly, no trial-and-error parsing;
+		# anything else is returned as-is (might be a datetime string)
+		return _parse_numeric_date(value_str) or value_str
 	
 	def dynamic_search(self, filters, limit=20, order_by="modified desc"):
 		"""
@@ -288,133 +413,7 @@ class BaseDocTypeHandler:
 			Search results
 		"""
 		try:
-			# Map common field names to actual field names
-			field_mapping = {
-				'created': 'creation',
-				'created_date': 'creation',
-				'date': 'transaction_date',
-				'order_date': 'transaction_date',
-			}
-			
-			# Build WHERE clause dynamically
-			conditions = []
-			values = {}
-			
-			# Get date fields for this doctype (to normalize date values)
-			date_fields = self.get_date_fields()
-			
-			for field, value in filters.items():
-				if value is None or value == "":
-					continue
-				
-				# Map field name if needed
-				actual_field = field_mapping.get(field, field)
-				
-				# Store original value for special handling of date keywords on datetime fields
-				original_value = value
-				
-				# Normalize date values if this is a date field
-				if actual_field in date_fields:
-					# For direct value (not operator), normalize it
-					if not isinstance(value, dict):
-						normalized_value = self.normalize_date_value(value, actual_field)
-						if normalized_value:
-							value = normalized_value
-				
-				if isinstance(value, dict):
-					# Handle operators
-					for operator, op_value in value.items():
-						# Normalize date values in operators too
-						if actual_field in date_fields:
-							normalized_op_value = self.normalize_date_value(op_value, actual_field)
-							if normalized_op_value:
-								op_value = normalized_op_value
-							else:
-								# If normalization failed, skip this filter
-								frappe.logger().warning(f"Date normalization failed for {actual_field} {operator} {op_value}, skipping filter")
-								continue
-						
-						# Create unique parameter name for operators to avoid conflicts
-						param_name = f"{actual_field}_{operator}"
-						
-						if operator == "$like":
-							conditions.append(f"`{actual_field}` LIKE %({param_name})s")
-							values[param_name] = op_value
-						elif operator == "$is_null":
-							conditions.append(f"(`{actual_field}` IS NULL OR `{actual_field}` = '' OR `{actual_field}` = 'Not Set')")
-						elif operator == "$is_not_null":
-							conditions.append(f"(`{actual_field}` IS NOT NULL AND `{actual_field}` != '' AND `{actual_field}` != 'Not Set')")
-						elif operator == "$gte":
-							# For datetime fields (creation, modified), compare as datetime (no DATE() wrapper)
-							# For date fields, use DATE() function for date-only comparison
-							if actual_field in ['creation', 'modified']:
-								# Datetime fields: compare full datetime (no DATE() wrapper)
-								conditions.append(f"`{actual_field}` >= %({param_name})s")
-							else:
-								# Date fields: use DATE() for date-only comparison
-								conditions.append(f"DATE(`{actual_field}`) >= DATE(%({param_name})s)")
-							values[param_name] = op_value
-							original_value = value.get(operator, op_value) if isinstance(value, dict) else op_value
-							frappe.logger().info(f"Date filter: {actual_field} >= {op_value} (normalized from '{original_value}')")
-						elif operator == "$lte":
-							if actual_field in ['creation', 'modified']:
-								# Datetime fields: compare full datetime
-								conditions.append(f"`{actual_field}` <= %({param_name})s")
-							else:
-								# Date fields: use DATE() for date-only comparison
-								conditions.append(f"DATE(`{actual_field}`) <= DATE(%({param_name})s)")
-							values[param_name] = op_value
-							original_value = value.get(operator, op_value) if isinstance(value, dict) else op_value
-							frappe.logger().info(f"Date filter: {actual_field} <= {op_value} (normalized from '{original_value}')")
-						elif operator == "$in":
-							placeholders = ", ".join([f"%({actual_field}_{i})s" for i in range(len(op_value))])
-							conditions.append(f"`{actual_field}` IN ({placeholders})")
-							for i, v in enumerate(op_value):
-								values[f"{actual_field}_{i}"] = v
-				else:
-					# For direct value comparison (not operator)
-					if actual_field in date_fields:
-						if actual_field in ['creation', 'modified']:
-							# Datetime fields: for "today", "yesterday", "tomorrow", use range (start of day to end of day)
-							# For other values, use direct comparison
-							# Check original value (before normalization) for date keywords
-							original_value_str = str(original_value).strip().lower() if not isinstance(original_value, dict) else None
-							if original_value_str in ['today', 'yesterday', 'tomorrow']:
-								# For date keywords on datetime fields, use range: >= start of day AND < start of next day
-								from frappe.utils import get_datetime
-								from datetime import timedelta
-								
-								# Calculate the target date
-								if original_value_str == 'today':
-									target_dt = getdate()
-								elif original_value_str == 'yesterday':
-									target_dt = getdate() - timedelta(days=1)
-								elif original_value_str == 'tomorrow':
-									target_dt = getdate() + timedelta(days=1)
-								
-								# Get start of target day and start of next day
-								target_start = get_datetime(target_dt).replace(hour=0, minute=0, second=0, microsecond=0)
-								next_day_start = target_start + timedelta(days=1)
-								target_start_str = frappe.db.format_datetime(target_start)
-								next_day_start_str = frappe.db.format_datetime(next_day_start)
-								
-								conditions.append(f"`{actual_field}` >= %({actual_field}_start)s AND `{actual_field}` < %({actual_field}_end)s")
-								values[f"{actual_field}_start"] = target_start_str
-								values[f"{actual_field}_end"] = next_day_start_str
-								frappe.logger().info(f"Date filter '{original_value_str}' for datetime field {actual_field}: {target_start_str} to {next_day_start_str}")
-							else:
-								# For other datetime values, use direct comparison
-								conditions.append(f"`{actual_field}` = %({actual_field})s")
-								values[actual_field] = value
-						else:
-							# Date fields: use DATE() function for date-only comparison
-							conditions.append(f"DATE(`{actual_field}`) = DATE(%({actual_field})s)")
-							values[actual_field] = value
-					else:
-						conditions.append(f"`{actual_field}` = %({actual_field})s")
-						values[actual_field] = value
-			
-			where_clause = " AND ".join(conditions) if conditions else "1=1"
+			where_clause, values = self._build_where(filters)
 			
 			# Get fields to select (override in subclasses)
 			select_fields = self.get_search_fields()
@@ -429,14 +428,17 @@ class BaseDocTypeHandler:
 			
 			values["limit"] = limit
 			
-			# Log the query for debugging
-			frappe.logger().info(f"Dynamic search query for {self.doctype}: {query}")
-			frappe.logger().info(f"Query values: {values}")
-			frappe.logger().info(f"Filters received: {filters}")
+			debug = frappe.conf.get("developer_mode")
+			if debug:
+				# Log the query for debugging
+				frappe.logger().debug(f"Dynamic search query for {self.doctype}: {query}")
+				frappe.logger().debug(f"Query values: {values}")
+				frappe.logger().debug(f"Filters received: {filters}")
 			
 			results = frappe.db.sql(query, values, as_dict=True)
 			
-			frappe.logger().info(f"Query returned {len(results)} results")
+			if debug:
+				frappe.logger().debug(f"Query returned {len(results)} results")
 			
 			return {
 				"status": "success",
@@ -451,6 +453,116 @@ class BaseDocTypeHandler:
 				"message": f"Search failed: {str(e)}"
 			}
 	
+	def _build_where(self, filters):
+		"""
+		Translate a dynamic_search filter dict into a SQL WHERE clause.
+		Predicates are SARGable: date columns are compared bare against ISO date
+		parameters (never wrapped in DATE()), so indexes on them stay usable.
+		
+		Args:
+			filters: Dict of filter conditions (direct values or {"$operator": value} dicts)
+		Returns:
+			(where_clause, values) for frappe.db.sql, "1=1" when nothing applies
+		Raises:
+			ValueError: for a filter on a field that is not a column of the doctype
+		"""
+		# Build WHERE clause dynamically
+		conditions = []
+		values = {}
+		
+		# Get date fields for this doctype (to normalize date values)
+		date_fields = self.get_date_fields()
+		valid_columns = _valid_columns(self.doctype)
+		
+		for field, value in filters.items():
+			if value is None or value == "":
+				continue
+			
+			# Map field name if needed
+			actual_field = self._FIELD_ALIAS.get(field, field)
+			
+			# Unknown fields must never reach the SQL text, and dropping them would silently widen the results
+			if actual_field not in valid_columns:
+				raise ValueError(f"Unknown filter field '{field}' for {self.doctype}")
+			
+			# Day keywords on datetime fields: half-open range over that day, no normalization needed
+			if actual_field in _DATETIME_FIELDS and actual_field in date_fields and not isinstance(value, dict):
+				keyword = str(value).strip().lower()
+				day_offset = _DAY_KEYWORD_OFFSETS.get(keyword)
+				if day_offset is not None:
+					day_start = datetime.combine(getdate() + timedelta(days=day_offset), datetime.min.time())
+					day_start_str = frappe.db.format_datetime(day_start)
+					next_day_start_str = frappe.db.format_datetime(day_start + timedelta(days=1))
+					
+					conditions.append(f"`{actual_field}` >= %({actual_field}_start)s AND `{actual_field}` < %({actual_field}_end)s")
+					values[f"{actual_field}_start"] = day_start_str
+					values[f"{actual_field}_end"] = next_day_start_str
+					if frappe.conf.get("developer_mode"):
+						frappe.logger().debug(f"Date filter '{keyword}' for datetime field {actual_field}: {day_start_str} to {next_day_start_str}")
+					continue
+			
+			# Store original value for logging invalid dates
+			original_value = value
+			
+			# Normalize date values if this is a date field
+			if actual_field in date_fields:
+				# For direct value (not operator), normalize it
+				if not isinstance(value, dict):
+					normalized_value = self.normalize_date_value(value, actual_field)
+					if normalized_value:
+						value = normalized_value
+			
+			if isinstance(value, dict):
+				# Handle operators
+				for operator, op_value in value.items():
+					# Normalize date values in operators too
+					if actual_field in date_fields:
+						normalized_op_value = self.normalize_date_value(op_value, actual_field)
+						if normalized_op_value:
+							op_value = normalized_op_value
+						else:
+							# If normalization failed, skip this filter
+							frappe.logger().warning(f"Date normalization failed for {actual_field} {operator} {op_value}, skipping filter")
+							continue
+					
+					# Create unique parameter name for operators to avoid conflicts
+					param_name = f"{actual_field}_{operator}"
+					
+					if operator in ("$gte", "$lte") and actual_field in date_fields and actual_field not in _DATETIME_FIELDS:
+						# Date fields: bare column against an ISO date keeps the index usable
+						op_value = _date_param(op_value)
+						if op_value is None:
+							frappe.logger().warning(f"Invalid date for {actual_field} {operator}, skipping filter")
+							continue
+					
+					builder = _OP_BUILDERS.get(operator)
+					if builder:
+						condition, condition_values = builder(actual_field, param_name, op_value)
+						conditions.append(condition)
+						values.update(condition_values)
+			else:
+				# For direct value comparison (not operator)
+				if actual_field in date_fields:
+					if actual_field in _DATETIME_FIELDS:
+						# Datetime fields: direct comparison (day keywords were handled above)
+						conditions.append(f"`{actual_field}` = %({actual_field})s")
+						values[actual_field] = value
+					else:
+						# Date fields: bare column against an ISO date keeps the index usable
+						date_value = _date_param(value)
+						if date_value is None:
+							frappe.logger().warning(f"Invalid date for {actual_field}: {original_value}, skipping filter")
+							continue
+						conditions.append(f"`{actual_field}` = %({actual_field})s")
+						values[actual_field] = date_value
+				else:
+					conditions.append(f"`{actual_field}` = %({actual_field})s")
+					values[actual_field] = value
+		
+		where_clause = " AND ".join(conditions) if conditions else "1=1"
+		
+		return where_clause, values
+	
 	def get_date_fields(self):
 		"""
 		Get list of date/datetime fields for this doctype.
@@ -463,7 +575,11 @@ class BaseDocTypeHandler:
 		Get fields to include in search results.
 		Override in subclasses to specify which fields to return.
 		"""
-		return "name, *"  # Default: all fields
+		return self._list_view_columns()
+	
+	def _list_view_columns(self):
+		"""name, modified, owner and the doctype's in_list_view columns, as a SELECT list."""
+		return _column_info(self.doctype)[1]
 	
 	def count_documents(self, filters=None):
 		"""
@@ -478,18 +594,33 @@ class BaseDocTypeHandler:
 		"""
 		try:
 			if filters:
-				# Use dynamic_search to count and get results
-				result = self.dynamic_search(filters, limit=10000)
-				count = result.get("count", 0)
-				results = result.get("results", [])
+				# Same WHERE as dynamic_search, but only the count leaves the database
+				where_clause, values = self._build_where(filters)
+				count = frappe.db.sql(
+					f"SELECT COUNT(*) FROM `tab{self.doctype}` WHERE {where_clause}",
+					values
+				)[0][0]
 				
 				response = {
 					"status": "success",
 					"total_count": count
 				}
 				
-				# If count is small (<= 5), include document names for context
-				if count > 0 and count <= 5 and results:
+				# If count is small (<= 5), include document names for context;
+				# the full row is only read when it is returned as first_result
+				if 0 < count <= 5:
+					select_fields = self.get_search_fields() if count == 1 else "`name`"
+					results = frappe.db.sql(
+						f"""
+						SELECT {select_fields}
+						FROM `tab{self.doctype}`
+						WHERE {where_clause}
+						ORDER BY modified desc
+						LIMIT 5
+						""",
+						values,
+						as_dict=True
+					)
 					document_names = [r.get("name") for r in results if r.get("name")]
 					if document_names:
 						response["document_names"] = document_names
@@ -511,27 +642,35 @@ class BaseDocTypeHandler:
 				"message": f"Count failed: {str(e)}"
 			}
 	
-	def get_document_details(self, name):
+	def get_document_details(self, name, lightweight=False):
 		"""
 		Get detailed information for a specific document.
 		Override in subclasses for custom detail retrieval.
 		
 		Args:
 			name: Document name/ID
+			lightweight: Read the document as plain rows (see get_document_dict) instead of
+				loading it through frappe.get_doc, for read-only callers
 		Returns:
 			Document details
 		"""
 		try:
-			if not frappe.db.exists(self.doctype, name):
+			if lightweight:
+				document = self.get_document_dict(name)
+			elif frappe.db.exists(self.doctype, name):
+				document = frappe.get_doc(self.doctype, name).as_dict()
+			else:
+				document = None
+			
+			if not document:
 				return {
 					"status": "error",
 					"message": f"{self.label} '{name}' not found"
 				}
 			
-			doc = frappe.get_doc(self.doctype, name)
 			return {
 				"status": "success",
-				"document": doc.as_dict()
+				"document": document
 			}
 		except Exception as e:
 			frappe.logger().error(f"Get details error for {self.doctype}: {str(e)}")
@@ -539,4 +678,34 @@ class BaseDocTypeHandler:
 				"status": "error",
 				"message": f"Failed to get details: {str(e)}"
 			}
+	
+	def get_document_dict(self, name):
+		"""
+		Read a document and its child tables as plain frappe._dict rows, shaped like
+		frappe.get_doc(...).as_dict() but without building the Document (controller, hooks, doc cache).
+		
+		Args:
+			name: Document name/ID
+		Returns:
+			frappe._dict, or None if the document does not exist
+		"""
+		meta = frappe.get_meta(self.doctype)
+		columns = [column for column in meta.get_valid_columns() if column != "doctype"]
+		document = frappe.db.get_value(self.doctype, name, columns, as_dict=True)
+		if not document:
+			return None
+		
+		document["doctype"] = self.doctype
+		for table_field in meta.get_table_fields():
+			rows = frappe.get_all(
+				table_field.options,
+				filters={"parent": document.name, "parenttype": self.doctype, "parentfield": table_field.fieldname},
+				fields=["*"],
+				order_by="idx asc"
+			)
+			for row in rows:
+				row["doctype"] = table_field.options
+			document[table_field.fieldname] = rows
+		
+		return document
 
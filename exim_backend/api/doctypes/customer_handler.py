@@ -5,9 +5,39 @@ Contains all customer-specific logic and operations.
 
 import frappe
 import json
+import re
 from exim_backend.api.doctypes.base_handler import BaseDocTypeHandler
 
 
+# FULLTEXT index on tabCustomer, created by exim_backend.patches.v0_0.add_customer_search_fulltext_index
+CUSTOMER_FULLTEXT_INDEX = "customer_search_fulltext"
+CUSTOMER_FULLTEXT_COLUMNS = "name, customer_name, mobile_no, email_id"
+
+# InnoDB ignores words shorter than innodb_ft_min_token_size (3 by default)
+_FULLTEXT_MIN_TERM_LENGTH = 3
+_SEARCH_TERM_RE = re.compile(r"\w+")
+
+_CUSTOMER_SEARCH_COLUMNS = """
+	name,
+	customer_name,
+	customer_type,
+	mobile_no,
+	email_id,
+	customer_primary_contact,
+	territory,
+	customer_group,
+	default_currency,
+	default_price_list,
+	creation,
+	modified
+"""
+
+
+def _name_key(customer_name):
+	"""Grouping key for customer names matching the database collation (case-insensitive, padded)."""
+	return (customer_name or "").strip().casefold()
+
+
 class CustomerHandler(BaseDocTypeHandler):
 	"""Handler for Customer doctype operations."""
 	
@@ -133,18 +163,22 @@ class CustomerHandler(BaseDocTypeHandler):
 		except Exception as e:
 			frappe.logger().error(f"Failed to create address: {str(e)}")
 	
-	def get_document_details(self, name):
+	def get_document_details(self, name, lightweight=False):
 		"""Get detailed customer information including address and contacts."""
 		try:
-			if not frappe.db.exists(self.doctype, name):
+			if lightweight:
+				customer_data = self.get_document_dict(name)
+			elif frappe.db.exists(self.doctype, name):
+				customer_data = frappe.get_doc(self.doctype, name).as_dict()
+			else:
+				customer_data = None
+			
+			if not customer_data:
 				return {
 					"status": "error",
 					"message": f"{self.label} '{name}' not found"
 				}
 			
-			doc = frappe.get_doc(self.doctype, name)
-			customer_data = doc.as_dict()
-			
 			# Get primary address (with error handling)
 			address = None
 			try:
@@ -210,7 +244,8 @@ class CustomerHandler(BaseDocTypeHandler):
 	def search_by_query(self, query, limit=10):
 		"""
 		Search customers by name, email, or mobile.
-		Legacy method for backward compatibility.
+		Uses the FULLTEXT index (word-prefix match) and falls back to a substring
+		LIKE scan when the index is missing or finds nothing.
 		"""
 		try:
 			if not query:
@@ -219,32 +254,22 @@ class CustomerHandler(BaseDocTypeHandler):
 					"message": "Search query is required"
 				}
 			
-			customers = frappe.db.sql("""
-				SELECT 
-					name,
-					customer_name,
-					customer_type,
-					mobile_no,
-					email_id,
-					customer_primary_contact,
-					territory,
-					customer_group,
-					default_currency,
-					default_price_list,
-					creation,
-					modified
-				FROM `tabCustomer`
-				WHERE 
-					customer_name LIKE %(search)s
-					OR mobile_no LIKE %(search)s
-					OR email_id LIKE %(search)s
-					OR name LIKE %(search)s
-				ORDER BY modified DESC
-				LIMIT %(limit)s
-			""", {
-				"search": f"%{query}%",
-				"limit": limit
-			}, as_dict=True)
+			customers = self._fulltext_search(query, limit)
+			if not customers:
+				customers = frappe.db.sql(f"""
+					SELECT {_CUSTOMER_SEARCH_COLUMNS}
+					FROM `tabCustomer`
+					WHERE 
+						customer_name LIKE %(search)s
+						OR mobile_no LIKE %(search)s
+						OR email_id LIKE %(search)s
+						OR name LIKE %(search)s
+					ORDER BY modified DESC
+					LIMIT %(limit)s
+				""", {
+					"search": f"%{query}%",
+					"limit": limit
+				}, as_dict=True)
 			
 			return {
 				"status": "success",
@@ -258,6 +283,34 @@ class CustomerHandler(BaseDocTypeHandler):
 				"message": f"Search failed: {str(e)}"
 			}
 	
+	def _fulltext_search(self, query, limit):
+		"""
+		Match every word of query as a prefix against the customer FULLTEXT index.
+		Returns an empty list when the query has no indexable words or the index is unavailable.
+		"""
+		if frappe.db.db_type != "mariadb":
+			return []
+		
+		terms = [t for t in _SEARCH_TERM_RE.findall(query) if len(t) >= _FULLTEXT_MIN_TERM_LENGTH]
+		if not terms:
+			return []
+		
+		try:
+			return frappe.db.sql(f"""
+				SELECT {_CUSTOMER_SEARCH_COLUMNS}
+				FROM `tabCustomer`
+				WHERE MATCH({CUSTOMER_FULLTEXT_COLUMNS}) AGAINST (%(against)s IN BOOLEAN MODE)
+				ORDER BY modified DESC
+				LIMIT %(limit)s
+			""", {
+				"against": " ".join(f"+{t}*" for t in terms),
+				"limit": limit
+			}, as_dict=True)
+		except Exception as e:
+			# Index not created yet (migrate pending)
+			frappe.logger().warning(f"Customer full-text search unavailable: {str(e)}")
+			return []
+	
 	def count_with_breakdown(self):
 		"""
 		Count customers with breakdown by territory and group.
@@ -303,8 +356,7 @@ class CustomerHandler(BaseDocTypeHandler):
 			query = """
 				SELECT 
 					customer_name,
-					COUNT(*) as count,
-					GROUP_CONCAT(name SEPARATOR ', ') as customer_ids
+					COUNT(*) as count
 				FROM `tabCustomer`
 				GROUP BY customer_name
 				HAVING COUNT(*) > 1
@@ -313,27 +365,33 @@ class CustomerHandler(BaseDocTypeHandler):
 			
 			duplicates = frappe.db.sql(query, as_dict=True)
 			
-			# Get detailed info for each duplicate
-			duplicate_details = []
-			for dup in duplicates:
-				customer_ids = dup['customer_ids'].split(', ')
-				customers = []
-				
-				for cust_id in customer_ids:
-					customer = frappe.db.get_value(
-						"Customer",
-						cust_id,
-						["name", "customer_name", "mobile_no", "email_id", "territory", "customer_group"],
-						as_dict=True
-					)
-					if customer:
-						customers.append(customer)
-				
-				duplicate_details.append({
+			# Fetch every duplicated customer in one query and group them by name. The database
+			# compares names case-insensitively and ignores trailing spaces, so group the same way.
+			customers_by_name = {}
+			if duplicates:
+				names = tuple(dup['customer_name'] for dup in duplicates if dup['customer_name'] is not None)
+				conditions = []
+				if names:
+					conditions.append("customer_name IN %(names)s")
+				if len(names) < len(duplicates):
+					conditions.append("customer_name IS NULL")
+				rows = frappe.db.sql(f"""
+					SELECT name, customer_name, mobile_no, email_id, territory, customer_group
+					FROM `tabCustomer`
+					WHERE {" OR ".join(conditions)}
+					ORDER BY name
+				""", {"names": names}, as_dict=True)
+				for row in rows:
+					customers_by_name.setdefault(_name_key(row['customer_name']), []).append(row)
+			
+			duplicate_details = [
+				{
 					"customer_name": dup['customer_name'],
 					"count": dup['count'],
-					"customers": customers
-				})
+					"customers": customers_by_name.get(_name_key(dup['customer_name']), [])
+				}
+				for dup in duplicates
+			]
 			
 			return {
 				"status": "success",
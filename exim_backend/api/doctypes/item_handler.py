@@ -145,8 +145,8 @@ class ItemHandler(BaseDocTypeHandler):
 				"message": f"Failed to create {self.label}: {str(e)}"
 			}
 	
-	def get_document_details(self, name):
-		"""Get detailed item information."""
+	def get_document_details(self, name, lightweight=False):
+		"""Get detailed item information. lightweight reads plain rows instead of the Document."""
 		try:
 			original_name = name
 			frappe.logger().info(f"Getting item details for: '{name}'")
@@ -194,8 +194,12 @@ class ItemHandler(BaseDocTypeHandler):
 			
 			# Get the document
 			frappe.logger().info(f"Loading item document: {name}")
-			doc = frappe.get_doc(self.doctype, name)
-			item_data = doc.as_dict()
+			if lightweight:
+				# frappe._dict, so the doc.<field> reads below work the same
+				doc = item_data = self.get_document_dict(name)
+			else:
+				doc = frappe.get_doc(self.doctype, name)
+				item_data = doc.as_dict()
 			
 			if not item_data:
 				error_msg = f"Failed to retrieve item data for '{name}'"
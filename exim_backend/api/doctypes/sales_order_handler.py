@@ -8,6 +8,23 @@ import json
 from frappe.utils import nowdate, add_days
 from exim_backend.api.doctypes.base_handler import BaseDocTypeHandler
 
+# Fixed statement for get_total_quantity_sold_batch, open date bounds are passed as the extremes below
+QUANTITY_SOLD_BATCH_SQL = """
+	SELECT 
+		soi.item_code,
+		MAX(soi.item_name) as item_name,
+		SUM(soi.qty) as total_qty,
+		SUM(soi.amount) as total_amount,
+		COUNT(DISTINCT so.name) as order_count
+	FROM `tabSales Order Item` soi
+	INNER JOIN `tabSales Order` so ON so.name = soi.parent
+	WHERE soi.item_code IN %(item_codes)s
+		AND so.transaction_date BETWEEN %(from_date)s AND %(to_date)s
+	GROUP BY soi.item_code
+"""
+_MIN_DATE = "0001-01-01"
+_MAX_DATE = "9999-12-31"
+
 
 class SalesOrderHandler(BaseDocTypeHandler):
 	"""Handler for Sales Order doctype operations."""
@@ -194,18 +211,22 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to create {self.label}: {error_msg}"
 			}
 	
-	def get_document_details(self, name):
-		"""Get detailed sales order information."""
+	def get_document_details(self, name, lightweight=False):
+		"""Get detailed sales order information. lightweight reads plain rows instead of the Document."""
 		try:
-			if not frappe.db.exists(self.doctype, name):
+			if lightweight:
+				sales_order_data = self.get_document_dict(name)
+			elif frappe.db.exists(self.doctype, name):
+				sales_order_data = frappe.get_doc(self.doctype, name).as_dict()
+			else:
+				sales_order_data = None
+			
+			if not sales_order_data:
 				return {
 					"status": "error",
 					"message": f"{self.label} '{name}' not found"
 				}
 			
-			doc = frappe.get_doc(self.doctype, name)
-			sales_order_data = doc.as_dict()
-			
 			# Include items information
 			if sales_order_data.get("items"):
 				# Items are already included in as_dict()
@@ -341,7 +362,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to get customers by order value: {str(e)}"
 			}
 	
-	def get_orders_by_customer_group(self, customer_group):
+	def get_orders_by_customer_group(self, customer_group, result_key="sales_orders"):
 		"""Get sales orders filtered by customer group."""
 		try:
 			# Join with Customer to filter by customer_group
@@ -367,7 +388,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 			return {
 				"status": "success",
 				"count": len(results),
-				"results": results
+				result_key: results
 			}
 		except Exception as e:
 			frappe.logger().error(f"Get orders by customer group error: {str(e)}")
@@ -376,7 +397,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to get orders by customer group: {str(e)}"
 			}
 	
-	def get_orders_by_territory(self, territory):
+	def get_orders_by_territory(self, territory, result_key="sales_orders"):
 		"""Get sales orders filtered by territory."""
 		try:
 			# Join with Customer to filter by territory
@@ -402,7 +423,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 			return {
 				"status": "success",
 				"count": len(results),
-				"results": results
+				result_key: results
 			}
 		except Exception as e:
 			frappe.logger().error(f"Get orders by territory error: {str(e)}")
@@ -411,7 +432,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to get orders by territory: {str(e)}"
 			}
 	
-	def get_orders_by_item(self, item_code):
+	def get_orders_by_item(self, item_code, result_key="sales_orders"):
 		"""Get sales orders containing a specific item."""
 		try:
 			query = """
@@ -439,7 +460,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 			return {
 				"status": "success",
 				"count": len(results),
-				"results": results
+				result_key: results
 			}
 		except Exception as e:
 			frappe.logger().error(f"Get orders by item error: {str(e)}")
@@ -448,7 +469,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to get orders by item: {str(e)}"
 			}
 	
-	def get_orders_with_most_items(self, limit=10, order_by="item_count desc"):
+	def get_orders_with_most_items(self, limit=10, order_by="item_count desc", result_key="sales_orders"):
 		"""Get sales orders with most line items, ordered by item count."""
 		try:
 			query = f"""
@@ -472,7 +493,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 			return {
 				"status": "success",
 				"count": len(results),
-				"results": results
+				result_key: results
 			}
 		except Exception as e:
 			frappe.logger().error(f"Get orders with most items error: {str(e)}")
@@ -481,7 +502,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to get orders with most items: {str(e)}"
 			}
 	
-	def get_orders_by_item_group(self, item_group):
+	def get_orders_by_item_group(self, item_group, result_key="sales_orders"):
 		"""Get sales orders containing items from a specific item group."""
 		try:
 			# Join with Sales Order Item and Item to filter by item_group
@@ -510,7 +531,7 @@ class SalesOrderHandler(BaseDocTypeHandler):
 			return {
 				"status": "success",
 				"count": len(results),
-				"results": results
+				result_key: results
 			}
 		except Exception as e:
 			frappe.logger().error(f"Get orders by item group error: {str(e)}")
@@ -579,6 +600,44 @@ class SalesOrderHandler(BaseDocTypeHandler):
 				"message": f"Failed to get total quantity sold: {str(e)}"
 			}
 	
+	def get_total_quantity_sold_batch(self, item_codes, from_date=None, to_date=None):
+		"""
+		Get total quantity sold for several items within a date range in one query.
+		Items without sales are returned with zero totals.
+		"""
+		try:
+			item_codes = list(dict.fromkeys(item_codes))
+			params = {
+				"item_codes": tuple(item_codes),
+				"from_date": self.normalize_date_value(from_date, "transaction_date") if from_date else _MIN_DATE,
+				"to_date": self.normalize_date_value(to_date, "transaction_date") if to_date else _MAX_DATE
+			}
+			rows = {row.item_code: row for row in frappe.db.sql(QUANTITY_SOLD_BATCH_SQL, params, as_dict=True)}
+			
+			items = {}
+			for item_code in item_codes:
+				row = rows.get(item_code)
+				items[item_code] = {
+					"item_name": row.item_name if row else None,
+					"total_qty": row.total_qty if row else 0,
+					"total_amount": row.total_amount if row else 0,
+					"order_count": row.order_count if row else 0
+				}
+			
+			return {
+				"status": "success",
+				"count": len(items),
+				"items": items,
+				"from_date": from_date,
+				"to_date": to_date
+			}
+		except Exception as e:
+			frappe.logger().error(f"Get total quantity sold batch error: {str(e)}")
+			return {
+				"status": "error",
+				"message": f"Failed to get total quantity sold: {str(e)}"
+			}
+	
 	def get_most_sold_items(self, limit=10, order_by="total_qty desc", from_date=None, to_date=None):
 		"""Get most sold items aggregated by item_code, ordered by total quantity."""
 		try:
@@ -167,26 +167,31 @@ class SalesPersonHandler(BaseDocTypeHandler):
 				"message": f"Failed to create {self.label}: {error_msg}"
 			}
 	
-	def get_document_details(self, name):
+	def get_document_details(self, name, lightweight=False):
 		"""
 		Get detailed sales person information.
 		
 		Args:
 			name: Sales Person name/ID
+			lightweight: Read plain rows (get_document_dict) instead of loading the Document
 		
 		Returns:
 			dict: Sales person details including targets
 		"""
 		try:
-			if not frappe.db.exists(self.doctype, name):
+			if lightweight:
+				sales_person_data = self.get_document_dict(name)
+			elif frappe.db.exists(self.doctype, name):
+				sales_person_data = frappe.get_doc(self.doctype, name).as_dict()
+			else:
+				sales_person_data = None
+			
+			if not sales_person_data:
 				return {
 					"status": "error",
 					"message": f"{self.label} '{name}' not found"
 				}
 			
-			doc = frappe.get_doc(self.doctype, name)
-			sales_person_data = doc.as_dict()
-			
 			# Include targets information if available
 			if sales_person_data.get("targets"):
 				# Targets are already included in as_dict()
@@ -26,6 +26,10 @@ def run_tests():
 	print("\nTEST 2: AI Extractor")
 	test_ai_extractor()
 	
+	# Test 2b: Numeric identifiers in AI output
+	print("\nTEST 2b: Numeric Identifiers in AI Output")
+	test_numeric_identifiers()
+	
 	# Test 3: Test Complete Workflow (with mock PDF)
 	print("\nTEST 3: Complete Workflow")
 	test_complete_workflow()
@@ -137,6 +141,28 @@ def test_ai_extractor():
 	return result
 
 
+def test_numeric_identifiers():
+	"""AI output with numeric item codes / PO numbers must parse, with the values kept as text."""
+	from exim_backend.api.ai_extractor import SalesOrderModel, _parse_extraction
+	
+	content = '{"customer": "ABC Corporation", "po_no": 45012, "items": [{"item_code": 1001, "qty": 10, "rate": 100.0}]}'
+	data = _parse_extraction(content)
+	
+	if SalesOrderModel is None:
+		# Without pydantic the JSON is returned unvalidated, numbers stay numbers
+		assert data["po_no"] == 45012, data
+		assert data["items"][0]["item_code"] == 1001, data
+		print("⚠ pydantic not installed, output not validated (numbers kept as-is)")
+		return data
+	
+	assert data["po_no"] == "45012", data
+	assert data["items"][0]["item_code"] == "1001", data
+	assert data["items"][0]["qty"] == 10
+	print("✓ Numeric po_no / item_code accepted as text")
+	
+	return data
+
+
 def test_complete_workflow():
 	"""Test complete PDF sales order workflow."""
 	handler = PDFSalesOrderHandler()
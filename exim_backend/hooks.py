@@ -145,6 +145,22 @@ app_license = "mit"
 # 	}
 # }
 
+# drop cached field payloads (api.doctype_fields) on schema changes
+doc_events = {
+	"DocType": {
+		"on_update": "exim_backend.api.doctype_fields.clear_fields_cache",
+		"on_trash": "exim_backend.api.doctype_fields.clear_fields_cache"
+	},
+	"Custom Field": {
+		"on_update": "exim_backend.api.doctype_fields.clear_fields_cache",
+		"on_trash": "exim_backend.api.doctype_fields.clear_fields_cache"
+	},
+	"Property Setter": {
+		"on_update": "exim_backend.api.doctype_fields.clear_fields_cache",
+		"on_trash": "exim_backend.api.doctype_fields.clear_fields_cache"
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -199,6 +215,14 @@ app_license = "mit"
 # before_request = ["exim_backend.utils.before_request"]
 # after_request = ["exim_backend.utils.after_request"]
 
+# Cache
+# ----------
+# reset process-level caches on `bench clear-cache`
+clear_cache = [
+	"exim_backend.api.ai_chat.clear_module_caches",
+	"exim_backend.api.ai_extractor.clear_module_caches",
+]
+
 # Job Events
 # ----------
 # before_job = ["exim_backend.utils.before_job"]
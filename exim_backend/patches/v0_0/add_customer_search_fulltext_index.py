@@ -0,0 +1,20 @@
+"""
+Add a FULLTEXT index used by CustomerHandler.search_by_query.
+A leading-wildcard LIKE on four columns cannot use B-tree indexes and scans the whole table.
+"""
+
+import frappe
+
+from exim_backend.api.doctypes.customer_handler import CUSTOMER_FULLTEXT_COLUMNS, CUSTOMER_FULLTEXT_INDEX
+
+
+def execute():
+	if frappe.db.db_type != "mariadb":
+		return
+
+	if frappe.db.sql("SHOW INDEX FROM `tabCustomer` WHERE Key_name = %s", CUSTOMER_FULLTEXT_INDEX):
+		return
+
+	frappe.db.sql_ddl(
+		f"ALTER TABLE `tabCustomer` ADD FULLTEXT INDEX `{CUSTOMER_FULLTEXT_INDEX}` ({CUSTOMER_FULLTEXT_COLUMNS})"
+	)
@@ -304,8 +304,11 @@
 					'System Prompt Length': `${promptInfo.system_prompt_length} chars (${promptInfo.system_prompt_tokens} tokens)`
 				});
 
-				console.log('%c\n📝 System Prompt Preview:', 'color: #10b981; font-weight: bold;');
-				console.log(promptInfo.system_prompt_preview);
+				// system_prompt_preview and full_messages are only sent when the request has debug=1
+				if (promptInfo.system_prompt_preview) {
+					console.log('%c\n📝 System Prompt Preview:', 'color: #10b981; font-weight: bold;');
+					console.log(promptInfo.system_prompt_preview);
+				}
 
 				console.log('%c\n📋 Messages Summary:', 'color: #10b981; font-weight: bold;');
 				promptInfo.messages_summary.forEach((msg, idx) => {
@@ -316,8 +319,10 @@
 					});
 				});
 
-				console.log('%c\n📦 Full Messages Array:', 'color: #10b981; font-weight: bold;');
-				console.log(promptInfo.full_messages);
+				if (promptInfo.full_messages) {
+					console.log('%c\n📦 Full Messages Array:', 'color: #10b981; font-weight: bold;');
+					console.log(promptInfo.full_messages);
+				}
 
 				console.log('%c\n💾 Full Prompt Info Object:', 'color: #10b981; font-weight: bold;');
 				console.log(promptInfo);